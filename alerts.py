@@ -0,0 +1,168 @@
+"""Уведомления подписчикам об изменениях статистики альбомов.
+
+Условия проверяются при сохранении статистики (db.save_stats_batch) по скользящим показателям альбома,
+готовые тексты складываются в таблицу alert_outbox, а бот отправляет их через SendQueue
+и удаляет из таблицы только после отправки."""
+import asyncio
+import heapq
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta
+import config
+
+# Виды подписок
+GROWTH = 'growth'        # прирост за сутки не меньше порога
+MILESTONE = 'milestone'  # прослушивания перешли отметку
+STALL = 'stall'          # сглаженный прирост за сутки меньше порога
+
+KINDS = {
+    GROWTH: "прирост в сутки от",
+    MILESTONE: "отметка",
+    STALL: "прирост в сутки меньше",
+}
+
+
+def _number(value):
+    return f'{value:,.0f}'.replace(',', ' ')
+
+
+def update_growth(ewma, previous_plays, plays, elapsed_days):
+    """Прирост прослушиваний в сутки с прошлой записи и его экспоненциальное скользящее среднее"""
+    if previous_plays is None or plays is None or elapsed_days <= 0:
+        return None, ewma
+
+    growth = (plays - previous_plays) / elapsed_days
+    if ewma is None:
+        return growth, growth
+    return growth, config.ALERT_EWMA_ALPHA * growth + (1 - config.ALERT_EWMA_ALPHA) * ewma
+
+
+def check_alert(kind, threshold, name, previous_plays, plays, growth, ewma):
+    """Текст уведомления, если условие подписки выполнено, иначе None"""
+    if kind == MILESTONE:
+        if previous_plays is not None and plays is not None and previous_plays < threshold <= plays:
+            return f"🏆 Альбом «{name}» преодолел отметку {_number(threshold)} прослушиваний! Сейчас: {_number(plays)}"
+    elif growth is None:
+        return None
+    elif kind == GROWTH and growth >= threshold:
+        return f"📈 Альбом «{name}»: +{_number(growth)} прослушиваний в сутки (в среднем {_number(ewma)})"
+    elif kind == STALL and ewma < threshold:
+        return f"💤 Альбом «{name}» почти не растёт: в среднем {_number(ewma)} прослушиваний в сутки"
+    return None
+
+
+def alert_due(kind, last_fired_at, now):
+    """Повторные уведомления о приросте и застое — не чаще раза в ALERT_COOLDOWN_HOURS"""
+    if kind == MILESTONE or last_fired_at is None:
+        return True
+    return now - datetime.fromisoformat(last_fired_at) >= timedelta(hours=config.ALERT_COOLDOWN_HOURS)
+
+
+class SendQueue:
+    """Очередь отправки уведомлений: не больше ALERTS_PER_SECOND сообщений в секунду всего
+    и не чаще раза в ALERT_CHAT_INTERVAL секунд в один чат, как требуют лимиты Telegram.
+
+    Уведомления остаются в alert_outbox, пока не отправлены: ID отправленных забирает take_sent(),
+    а неотправленные после перезапуска снова попадут в очередь из базы"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.chats = {}       # chat_id -> deque((ID в alert_outbox, текст)) в порядке отправки
+        self.next_slot = {}   # chat_id -> когда в этот чат можно написать следующее сообщение
+        self.ready = []       # куча (время, chat_id): когда у чата подойдёт очередь
+        self.wakeup = asyncio.Event()
+        self.sent = []        # ID отправленных уведомлений, которые нужно удалить из базы
+        self.last_id = 0      # последний ID, взятый из базы
+        self.count = 0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def pending(self):
+        """Сколько уведомлений ждёт отправки, включая отложенные из-за ограничения на чат"""
+        return self.count
+
+    def take_sent(self):
+        sent, self.sent = self.sent, []
+        return sent
+
+    def put(self, alert_id, chat_id, text):
+        """Сообщения одного чата отправляются строго по очереди, а чат, которому недавно писали,
+        не задерживает остальные"""
+        self.last_id = max(self.last_id, alert_id)
+        self.count += 1
+        if chat_id in self.chats:
+            self.chats[chat_id].append((alert_id, text))
+            return
+
+        self.chats[chat_id] = deque([(alert_id, text)])
+        self._schedule(chat_id, max(time.monotonic(), self.next_slot.get(chat_id, 0)))
+
+    def _schedule(self, chat_id, when):
+        heapq.heappush(self.ready, (when, chat_id))
+        self.wakeup.set()
+
+    def _done(self, chat_id):
+        """Первое сообщение чата обработано: следующее — не раньше чем через ALERT_CHAT_INTERVAL"""
+        alert_id, _ = self.chats[chat_id].popleft()
+        self.sent.append(alert_id)
+        self.count -= 1
+        now = time.monotonic()
+        self.next_slot[chat_id] = now + config.ALERT_CHAT_INTERVAL
+        if self.chats[chat_id]:
+            self._schedule(chat_id, self.next_slot[chat_id])
+        else:
+            del self.chats[chat_id]
+
+        if len(self.next_slot) > 10000:
+            self.next_slot = {chat: slot for chat, slot in self.next_slot.items() if slot > now}
+
+    async def _run(self):
+        # aiogram нужен только отправке: db.py импортирует из этого модуля проверку условий,
+        # и обработчикам, экспорту и обслуживанию базы клиент Telegram не нужен
+        from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+        while True:
+            self.wakeup.clear()
+            if not self.ready:
+                await self.wakeup.wait()
+                continue
+
+            delay = self.ready[0][0] - time.monotonic()
+            if delay > 0:
+                # Ждём очереди ближайшего чата или нового сообщения, которое может оказаться раньше
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, chat_id = heapq.heappop(self.ready)
+            _, text = self.chats[chat_id][0]
+            try:
+                await self.bot.send_message(chat_id, text)
+            except TelegramRetryAfter as e:
+                # Сообщение остаётся первым в своём чате
+                logging.warning(f"Telegram просит подождать {e.retry_after} с перед отправкой уведомлений")
+                self._schedule(chat_id, time.monotonic() + e.retry_after)
+                await asyncio.sleep(e.retry_after)
+                continue
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                # Бот заблокирован или чат недоступен — повтор не поможет
+                logging.warning(f"Уведомление в чат {chat_id} не доставлено: {e}")
+                self._done(chat_id)
+            except Exception as e:
+                logging.error(f"Не удалось отправить уведомление в чат {chat_id}, повторим позже: {e}")
+                self._schedule(chat_id, time.monotonic() + config.ALERT_RETRY_SECONDS)
+            else:
+                self._done(chat_id)
+
+            await asyncio.sleep(1 / config.ALERTS_PER_SECOND)
@@ -0,0 +1,86 @@
+"""Сборка бота: Bot с общей HTTP-сессией, диспетчер с обработчиками из handlers.py, хуки старта и остановки.
+Запускается через go.py"""
+import time
+_started = time.perf_counter()  # Отсчёт времени запуска, до импорта тяжёлых библиотек
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer, PRODUCTION
+import logging
+import config
+import db
+from db import init_db
+import scraper
+import charts
+import metrics
+import jobs
+import worker
+import handlers
+import scheduler
+import webhook
+from metrics import startup_seconds
+
+# Инициализация бота
+API_TOKEN = config.API_TOKEN
+# Одна HTTP-сессия с пулом соединений на все запросы к Bot API
+session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL) if config.TELEGRAM_API_URL else PRODUCTION,
+                         limit=config.TELEGRAM_CONNECTIONS)
+bot = Bot(token=API_TOKEN, session=session)
+dp = Dispatcher()
+dp.include_router(handlers.router)
+
+# Ограничение одновременно обрабатываемых апдейтов, его же дожидаемся при остановке
+update_limiter = webhook.UpdateLimiter(config.UPDATE_CONCURRENCY)
+dp.update.outer_middleware(update_limiter)
+
+imports_seconds = time.perf_counter() - _started
+startup_seconds.set(round(imports_seconds, 3), stage='imports')
+
+async def on_startup():
+    await init_db()  # Инициализация базы данных
+    await db.connect()  # Открываем общие соединения с базой
+    await scraper.start()  # HTTP-сессия для парсинга, браузер запускается только при необходимости
+
+    if config.METRICS_PORT:
+        await metrics.start_server(config.METRICS_HOST, config.METRICS_PORT)  # Метрики для Prometheus
+
+    if config.EMBEDDED_WORKER:
+        await worker.start_workers()  # Обработчики задач парсинга внутри бота
+
+    # Периодические задачи и уведомления подписчикам
+    await scheduler.start(bot)
+
+    charts.warm_up()  # Процессы отрисовки графиков запускаются в фоне, первый 📊 не ждёт их старта
+
+    if config.BOT_MODE == 'webhook':
+        await webhook.set_webhook(bot, dp)
+    else:
+        # getUpdates не работает, пока зарегистрирован вебхук
+        await bot.delete_webhook(drop_pending_updates=config.DROP_PENDING_UPDATES)
+
+    ready = time.perf_counter() - _started
+    startup_seconds.set(round(ready, 3), stage='ready')
+    logging.info(f"Бот готов к работе за {ready:.2f} с, из них импорт модулей {imports_seconds:.2f} с")
+
+async def on_shutdown():
+    await update_limiter.drain(config.SHUTDOWN_DRAIN_TIMEOUT)  # Дорабатываем начатые апдейты, в том числе отправку графиков
+    await metrics.stop_server()
+    await scheduler.stop()  # Останавливаем периодические задачи и отправку уведомлений
+    await worker.stop_workers(config.SHUTDOWN_DRAIN_TIMEOUT)  # Дорабатываем начатый парсинг и дописываем статистику
+    await scraper.stop()  # Закрываем браузер и все вкладки
+    await jobs.close_queue()
+    await db.close()  # Дожидаемся записи в базу и закрываем соединения
+    charts.shutdown()  # Останавливаем процессы отрисовки графиков
+
+# Регистрируем хуки для старта и остановки
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
+
+def main():
+    # Настройка логирования
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if config.BOT_MODE == 'webhook':
+        webhook.run(dp, bot)
+    else:
+        dp.run_polling(bot)
@@ -0,0 +1,278 @@
+"""Офлайн-бенчмарк горячих путей бота: парсинг, база данных, обновление статистики и графики.
+
+Страницы VK отдаются локальным HTTP-сервером из benchmarks/fixtures, база генерируется во временной папке.
+Результаты выводятся в JSON, чтобы их можно было сравнивать между коммитами:
+
+    python benchmarks/run.py --albums 10000 --stats 1000000 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+sys.path.insert(0, ROOT)
+
+import config
+from aiohttp import web
+import charts
+import db
+import handlers
+import scheduler
+import scraper
+import worker
+from utils import parse_plays
+from vk_html import parse_album_html
+
+PLAYS_SAMPLES = ['12K прослушиваний', '1,5 млн', '12 345 прослушиваний', '3,4 тыс. прослушиваний',
+                 '987', '2.1M', '0 прослушиваний', '12,4K прослушиваний\n 12 аудиозаписей']
+
+results = {}
+
+
+def record(name, ops, seconds, **extra):
+    results[name] = {"ops": ops, "total_s": round(seconds, 4), "per_op_ms": round(seconds * 1000 / max(ops, 1), 4), **extra}
+    logging.warning(f"{name}: {ops} операций за {seconds:.3f} с")
+
+
+async def measure(name, ops, func):
+    start = time.perf_counter()
+    for i in range(ops):
+        await func(i)
+    record(name, ops, time.perf_counter() - start)
+
+
+async def start_fixture_server():
+    """Локальная замена m.vk.com: на любую ссылку альбома или плейлиста отдаёт сохранённую страницу"""
+    pages = {}
+    for kind in ('album', 'playlist'):
+        with open(os.path.join(FIXTURES, f'{kind}.html'), encoding='utf-8') as file:
+            pages[kind] = file.read()
+
+    async def handler(request):
+        return web.Response(text=pages[request.match_info['kind']], content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/music/{kind:album|playlist}/{rest}', handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f'http://{host}:{port}'
+
+
+async def generate_database(albums, stats_rows):
+    """Синтетическая база: albums альбомов и около stats_rows записей статистики, по точке раз в 5 дней"""
+    await db.init_db()
+    await db.connect()
+
+    now = datetime.now()
+    date = now.strftime('%Y-%m-%d %H:%M:%S')
+    far_future = (now + timedelta(days=365)).strftime('%Y-%m-%d %H:%M:%S')
+
+    rows = [(f'-{i}_{i}', f'https://vk.com/music/album/-{i}_{i}_bench', f'Альбом {i}', f'Исполнитель {i % 500}',
+             'Хип-хоп · 2024', '1K', 1000, '12', date, far_future) for i in range(1, albums + 1)]
+    await db.write(lambda conn: conn.executemany('''
+        INSERT INTO albums (vk_key, url, name, nick, genre_year, counts, plays, track_count, date, next_due_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows))
+
+    points = max(stats_rows // albums, 1)
+    start = now - timedelta(days=5 * points)
+    chunk = []
+    for album_id in range(1, albums + 1):
+        plays = random.randint(100, 10000)
+        for point in range(points):
+            plays += random.randint(0, 500)
+            chunk.append((album_id, f'{plays}', plays, (start + timedelta(days=5 * point)).strftime('%Y-%m-%d %H:%M:%S')))
+
+        if len(chunk) >= 100000 or album_id == albums:
+            batch, chunk = chunk, []
+            await db.write(lambda conn: conn.executemany('INSERT INTO stats (aid, counts, plays, date) VALUES (?, ?, ?, ?)', batch))
+
+    # Дневная сводка для /top строится так же, как при переходе старой базы
+    await db.write(db.backfill_stats_daily)
+    return points
+
+
+# Холодный импорт бота (app.py) в отдельном процессе: время и какие тяжёлые библиотеки загрузились сразу
+STARTUP_CODE = '''
+import sys, time
+start = time.perf_counter()
+import config
+config.API_TOKEN = config.API_TOKEN or '123456:benchmark'
+import app
+print(time.perf_counter() - start, ','.join(m for m in ('aiogram', 'playwright', 'matplotlib', 'pandas') if m in sys.modules) or '-')
+'''
+
+
+def measure_startup(runs):
+    times = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', STARTUP_CODE], cwd=ROOT, text=True, stderr=subprocess.DEVNULL)
+        seconds, modules = output.strip().splitlines()[-1].split()
+        times.append(float(seconds))
+    record('startup_import_app', runs, sum(times), min_s=round(min(times), 4), heavy_modules=[] if modules == '-' else modules.split(','))
+
+
+# Первый график в новом процессе с лёгким главным модулем, как при запуске через go.py
+CHART_COLD_START_CODE = '''
+import asyncio, time
+from datetime import datetime
+start = time.perf_counter()
+import charts
+asyncio.run(charts.render_charts([([datetime(2024, 1, 1), datetime(2024, 1, 6)], [1000, 1200])]))
+print(time.perf_counter() - start)
+charts.shutdown()
+'''
+
+
+def measure_chart_cold_start(runs):
+    times = [float(subprocess.check_output([sys.executable, '-c', CHART_COLD_START_CODE], cwd=ROOT, text=True,
+                                           stderr=subprocess.DEVNULL).split()[-1]) for _ in range(runs)]
+    record('render_charts_cold_start', runs, sum(times), min_s=round(min(times), 4))
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix='vk_bench_')
+    db.DATABASE = config.DATABASE = os.path.join(workdir, 'bench.db')
+    db.DATA_FILE = config.DATA_FILE = os.path.join(workdir, 'albums_stats.json')
+
+    runner, base_url = await start_fixture_server()
+    config.SCRAPER_BACKEND = 'http'
+    config.SCRAPER_MOBILE_HOST = base_url
+    config.SCRAPE_RATE_PER_HOST = config.SCRAPE_BURST_PER_HOST = 10 ** 9
+    config.SCRAPE_RETRIES = 0
+    config.STATS_FLUSH_INTERVAL = 0.05  # Задачи обновления завершаются после сохранения пачки, не ждём её дольше нужного
+    await scraper.start()
+
+    try:
+        start = time.perf_counter()
+        points = await generate_database(args.albums, args.stats)
+        record('generate_database', args.albums * points, time.perf_counter() - start, albums=args.albums, points_per_album=points)
+
+        # Разбор строк с количеством прослушиваний
+        start = time.perf_counter()
+        for i in range(args.ops * 100):
+            parse_plays(PLAYS_SAMPLES[i % len(PLAYS_SAMPLES)])
+        record('parse_plays', args.ops * 100, time.perf_counter() - start)
+
+        # Разбор сохранённой страницы альбома без сети
+        with open(os.path.join(FIXTURES, 'album.html'), encoding='utf-8') as file:
+            album_html = file.read()
+        start = time.perf_counter()
+        for _ in range(args.ops):
+            parse_album_html(album_html, 'https://vk.com/music/album/-1_1')
+        record('parse_album_html', args.ops, time.perf_counter() - start)
+
+        # Полный путь get_album_info через локальный сервер, каждый раз новый альбом (без кэша)
+        await measure('get_album_info', args.ops,
+                      lambda i: scraper.get_album_info(f'https://vk.com/music/album/-{10 ** 9 + i}_{i}'))
+
+        album_ids = [random.randint(1, args.albums) for _ in range(args.ops)]
+        await measure('fetchallStats', args.ops, lambda i: db.fetchallStats(album_ids[i]))
+
+        async def buckets(i):
+            async for _ in db.iter_stats_buckets(album_ids[i], bucket='day', limit=100):
+                pass
+        await measure('iter_stats_buckets', args.ops, buckets)
+
+        # Страницы /analyze без кэша клавиатур
+        pages = max(args.albums // config.ALBUMS_PAGE_SIZE, 1)
+
+        async def analyze_page(i):
+            handlers.keyboard_cache.clear()
+            await handlers.get_albums_page_keyboard(after_id=(i % pages) * config.ALBUMS_PAGE_SIZE)
+        await measure('analyze_albums_page', args.ops, analyze_page)
+
+        await measure('search_albums', args.ops, lambda i: db.search_albums(f'Исполнитель {i % 500}'))
+
+        # Рейтинг /top за 30 дней без кэша
+        since = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+        await measure('top_growth', args.ops, lambda i: db.top_growth(since, config.TOP_SIZE))
+
+        # Полный проход обновления статистики по refresh_albums альбомам: постановка задач и их выполнение
+        refresh_albums = min(args.refresh_albums, args.albums)
+        await db.write(lambda conn: conn.execute("UPDATE albums SET next_due_at = '2000-01-01 00:00:00' WHERE id <= ?",
+                                                 (refresh_albums,)))
+        scraper.scrape_cache.items.clear()
+        config.REFRESH_BATCH_LIMIT = refresh_albums
+        start = time.perf_counter()
+        await scheduler.update_album_stats()
+        record('enqueue_refresh_jobs', refresh_albums, time.perf_counter() - start)
+
+        # Обработчики из worker.py разбирают очередь, статистика дописывается при их остановке
+        await worker.start_workers()
+        while (await db.fetchone('SELECT COUNT(*) FROM jobs'))[0]:
+            await asyncio.sleep(0.05)
+        await worker.stop_workers()
+        record('update_album_stats', refresh_albums, time.perf_counter() - start)
+
+        # Отрисовка набора графиков как в show_stats: 10 графиков по 10 точек
+        dates = [datetime(2024, 1, 1) + timedelta(days=5 * i) for i in range(100)]
+        plays = [1000 + 37 * i for i in range(100)]
+        chunks = [(dates[i:i + 10], plays[i:i + 10]) for i in range(0, 100, 10)]
+
+        # Процессы пула здесь заново импортируют этот скрипт вместе с ботом, поэтому холодный старт
+        # замеряется отдельно (measure_chart_cold_start), а этот вызов только запускает пул
+        await charts.render_charts(chunks[:1])
+
+        await measure('render_charts_10', args.chart_ops, lambda i: charts.render_charts(chunks))
+    finally:
+        charts.shutdown()
+        await scraper.stop()
+        await db.close()
+        await runner.cleanup()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк VK Album Analyzer")
+    parser.add_argument('--albums', type=int, default=10000, help="количество альбомов в синтетической базе")
+    parser.add_argument('--stats', type=int, default=1000000, help="количество записей статистики в синтетической базе")
+    parser.add_argument('--ops', type=int, default=200, help="количество повторов для каждого замера")
+    parser.add_argument('--refresh-albums', type=int, default=1000, help="сколько альбомов обновить в замере update_album_stats")
+    parser.add_argument('--chart-ops', type=int, default=5, help="сколько раз отрисовать набор из 10 графиков")
+    parser.add_argument('--startup-runs', type=int, default=3, help="сколько раз замерить холодный импорт app.py")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="файл для результатов в JSON (по умолчанию — stdout)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    random.seed(args.seed)
+    measure_startup(args.startup_runs)
+    measure_chart_cold_start(args.startup_runs)
+    asyncio.run(run(args))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "python": sys.version.split()[0],
+        "params": vars(args),
+        "results": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
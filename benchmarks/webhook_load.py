@@ -0,0 +1,171 @@
+"""Нагрузочный тест режима вебхука: бот запускается в этом же процессе, а синтетические апдейты
+отправляются POST-запросами на его вебхук. Вместо api.telegram.org бот обращается к локальной
+заглушке Bot API, которая отвечает на любой метод и запоминает, когда пришёл ответ в каждый чат.
+
+Задержка — время от отправки апдейта до ответа бота в тот же чат, пропускная способность — апдейтов
+в секунду от первой отправки до последнего ответа. Результаты выводятся в JSON:
+
+    python benchmarks/webhook_load.py --updates 2000 --concurrency 100 --text /top
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import secrets
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+from aiohttp import ClientSession, web
+
+CHAT_ID_BASE = 1000000
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    pick = lambda q: round(values[min(int(len(values) * q), len(values) - 1)] * 1000, 2)
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": round(values[-1] * 1000, 2),
+            "mean_ms": round(statistics.mean(values) * 1000, 2)}
+
+
+async def start_stub_api(replies):
+    """Заглушка Bot API: на методы отправки и изменения сообщений возвращает сообщение, на остальные — True"""
+    async def handle(request):
+        method = request.match_info['method']
+        data = dict(await request.post()) if request.can_read_body else {}
+        chat_id = int(data.get('chat_id', 0))
+        if chat_id:
+            replies.setdefault(chat_id, time.perf_counter())
+
+        message = {"message_id": 1, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}, "text": "ok"}
+        if method == 'getMe':
+            result = {"id": 1, "is_bot": True, "first_name": "Bot", "username": "load_test_bot"}
+        elif method == 'sendMediaGroup':
+            result = [message]
+        elif method.startswith(('send', 'edit')):
+            result = message
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f'http://{host}:{port}'
+
+
+def make_update(i, text):
+    chat_id = CHAT_ID_BASE + i
+    return {"update_id": i + 1, "message": {
+        "message_id": i + 1, "date": int(time.time()), "text": text,
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+    }}
+
+
+async def run(args):
+    replies = {}
+    stub, api_url = await start_stub_api(replies)
+
+    # Бот создаётся при импорте app.py, поэтому настройки меняются до него
+    workdir = tempfile.mkdtemp(prefix='vk_webhook_')
+    config.API_TOKEN = '123456:webhook-load'
+    config.TELEGRAM_API_URL = api_url
+    config.BOT_MODE = 'webhook'
+    config.WEBHOOK_URL = ''
+    config.WEBHOOK_SECRET = secrets.token_hex(16)
+    config.METRICS_PORT = 0
+    config.EMBEDDED_WORKER = False
+    config.TEST_MODE = 0
+    config.UPDATE_CONCURRENCY = args.update_concurrency or config.UPDATE_CONCURRENCY
+    config.DATABASE = args.database or os.path.join(workdir, 'bench.db')
+    config.DATA_FILE = os.path.join(workdir, 'albums_stats.json')
+
+    import db
+    db.DATABASE, db.DATA_FILE = config.DATABASE, config.DATA_FILE
+    import app
+    import webhook
+
+    runner = web.AppRunner(webhook.create_app(app.dp, app.bot), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    url = f'http://{host}:{port}{config.WEBHOOK_PATH}'
+    headers = {'X-Telegram-Bot-Api-Secret-Token': config.WEBHOOK_SECRET}
+
+    sent, acks = {}, []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def post(client, i):
+        async with semaphore:
+            start = time.perf_counter()
+            sent[CHAT_ID_BASE + i] = start
+            async with client.post(url, json=make_update(i, args.text), headers=headers) as response:
+                response.raise_for_status()
+            acks.append(time.perf_counter() - start)
+
+    try:
+        started = time.perf_counter()
+        async with ClientSession() as client:
+            await asyncio.gather(*(post(client, i) for i in range(args.updates)))
+
+        # Ждём ответа бота во все чаты
+        deadline = time.perf_counter() + args.timeout
+        while len(replies) < args.updates and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        finished = max(replies.values(), default=started)
+    finally:
+        # Остановка как в бою: новые апдейты не принимаются, начатые дорабатываются
+        await runner.cleanup()
+        await stub.cleanup()
+
+    latencies = [replies[chat_id] - start for chat_id, start in sent.items() if chat_id in replies]
+    return {
+        "updates": args.updates,
+        "answered": len(latencies),
+        "text": args.text,
+        "client_concurrency": args.concurrency,
+        "update_concurrency": config.UPDATE_CONCURRENCY,
+        "total_s": round(finished - started, 4),
+        "updates_per_s": round(len(latencies) / max(finished - started, 1e-9), 1),
+        "ack": percentiles(acks),
+        "reply": percentiles(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест вебхука VK Album Analyzer")
+    parser.add_argument('--updates', type=int, default=1000, help="сколько апдейтов отправить")
+    parser.add_argument('--concurrency', type=int, default=50, help="сколько запросов к вебхуку отправлять одновременно")
+    parser.add_argument('--update-concurrency', type=int, help="UPDATE_CONCURRENCY бота, по умолчанию из config.py")
+    parser.add_argument('--text', default='/start', help="текст сообщения в каждом апдейте, например /start, /top или /analyze")
+    parser.add_argument('--database', help="готовая база для команд вроде /analyze, по умолчанию — пустая временная")
+    parser.add_argument('--timeout', type=float, default=60, help="сколько секунд ждать ответов бота")
+    parser.add_argument('--output', help="файл для результатов в JSON (по умолчанию — stdout)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    report = asyncio.run(run(args))
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
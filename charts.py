@@ -0,0 +1,111 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import config
+
+# Пул процессов для отрисовки графиков, чтобы matplotlib не блокировал цикл событий бота
+_executor = None
+
+# Заготовка графика, создаётся один раз в каждом процессе пула
+_figure = None
+_ax = None
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _template():
+    """Фигура с настроенными осями, переиспользуется для всех графиков процесса"""
+    global _figure, _ax
+    if _figure is None:
+        from matplotlib.figure import Figure
+        from matplotlib.dates import DateFormatter, DayLocator
+
+        _figure = Figure(figsize=(10, 5))
+        _ax = _figure.add_subplot()
+
+        # Настройка оси X для правильного отображения
+        _ax.xaxis.set_major_locator(DayLocator(interval=5))  # Интервал 5 дней
+        _ax.xaxis.set_major_formatter(DateFormatter("%d %b"))  # Форматируем ось X как день и месяц
+
+        # Добавление подписей
+        _ax.set_xlabel("Дата")
+        _ax.set_ylabel("Количество прослушиваний")
+    return _figure, _ax
+
+
+def render_chart(dates, plays, number):
+    """Рисует один график и возвращает PNG в виде байтов"""
+    fig, ax = _template()
+
+    # Убираем данные предыдущего графика, оставляя настройки осей
+    for artist in list(ax.lines) + list(ax.collections) + list(ax.texts):
+        artist.remove()
+    if ax.get_legend() is not None:
+        ax.get_legend().remove()
+
+    ax.plot(dates, plays, marker="o", label="Прослушивания", color="blue")
+
+    # Линии от оси X до каждой точки — одной коллекцией
+    ax.vlines(x=dates, ymin=0, ymax=plays, colors="gray", linestyle="dashed", linewidth=1)
+
+    # Добавляем текстовые метки с количеством над каждой точкой
+    for date, count in zip(dates, plays):
+        ax.annotate(f'{count}', (date, count), textcoords="offset points", xytext=(0, 10), ha='center')
+
+    # relim не учитывает коллекции, поэтому ось Y снова начинаем от нуля вручную
+    ax.relim()
+    ax.update_datalim([(ax.dataLim.x0, 0)])
+    ax.autoscale_view()
+    ax.set_title(f"Статистика прослушиваний каждые 5 дней (график {number})")
+    ax.legend(loc="upper left")
+
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def _prepare():
+    """Загрузка matplotlib и заготовки графика заранее, чтобы первый график рисовался сразу"""
+    _template()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # Процессы пула порождаются от сервера forkserver, в котором charts и matplotlib уже загружены;
+        # там, где его нет (Windows), — чистым запуском интерпретатора
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['charts', 'matplotlib.figure', 'matplotlib.dates', 'matplotlib.backends.backend_agg'])
+        else:
+            context = multiprocessing.get_context('spawn')
+        _executor = ProcessPoolExecutor(max_workers=config.CHART_PROCESSES, mp_context=context, initializer=_init_worker)
+    return _executor
+
+
+def warm_up():
+    """Запуск всех процессов пула в фоне при старте бота, не дожидаясь их готовности"""
+    executor = _get_executor()
+    for _ in range(config.CHART_PROCESSES):
+        executor.submit(_prepare)
+
+
+async def render_charts(chunks):
+    """Рисует графики для списка пар (даты, прослушивания) параллельно в пуле процессов"""
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    return await asyncio.gather(*[
+        loop.run_in_executor(executor, render_chart, list(dates), list(plays), i + 1)
+        for i, (dates, plays) in enumerate(chunks)
+    ])
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -1,4 +1,82 @@
 TEST_MODE = 2 # 0 - OFF, 1 = /test (parse testing), 2 = call the stats func, 3 = insert fake stats
 API_TOKEN = ''
 DATABASE = "albums.db"
-DATA_FILE = 'albums_stats.json'
+DATA_FILE = 'albums_stats.json' # старый файл с датами обновлений, переносится в базу при запуске
+SCRAPER_CONCURRENCY = 3 # сколько вкладок Chromium могут парсить одновременно
+SCRAPER_PAGE_MAX_USES = 50 # после скольких загрузок вкладка пересоздаётся
+SCRAPE_RATE_PER_HOST = 0.5 # сколько страниц в секунду можно запрашивать у одного хоста VK
+SCRAPE_BURST_PER_HOST = 3 # сколько запросов можно сделать сразу, без ожидания
+SCRAPE_RETRIES = 2 # количество повторных попыток парсинга при ошибке
+SCRAPE_RETRY_BASE_DELAY = 5 # базовая задержка перед повтором, в секундах
+REFRESH_WORKERS = 3 # количество одновременных обработчиков задач парсинга в одном процессе
+STATS_BATCH_SIZE = 50 # сколько записей статистики сохранять в базу за один коммит
+REFRESH_INTERVAL_DAYS = 5 # раз в сколько дней обновлять статистику нового альбома
+REFRESH_BATCH_LIMIT = 50 # сколько альбомов ставить в очередь за один проход планировщика
+REFRESH_TICK_MINUTES = 5 # как часто планировщик ищет альбомы, которым пора обновиться
+REFRESH_PENDING_MINUTES = 60 # на сколько откладывать альбом, поставленный в очередь, пока его задача не выполнена
+REFRESH_MIN_INTERVAL_HOURS = 12 # самый частый интервал обновления для быстро растущих альбомов
+REFRESH_MAX_INTERVAL_DAYS = 20 # самый редкий интервал обновления для замерших альбомов
+REFRESH_FAST_GROWTH = 0.01 # прирост прослушиваний за сутки (доля), при котором интервал сокращается вдвое
+REFRESH_SLOW_GROWTH = 0.001 # прирост за сутки, ниже которого интервал увеличивается в полтора раза
+REFRESH_JITTER = 0.1 # случайный разброс даты обновления, доля интервала
+SCRAPE_CACHE_TTL = 600 # сколько секунд хранить результат парсинга альбома в кэше
+SCRAPE_CACHE_SIZE = 1000 # максимальное количество альбомов в кэше парсинга
+CHART_PROCESSES = 2 # количество процессов для отрисовки графиков
+CHART_CACHE_SIZE = 500 # сколько наборов графиков (file_id в Telegram) хранить в кэше
+ALBUMS_PAGE_SIZE = 10 # сколько альбомов показывать на одной странице /analyze
+ALBUMS_PAGE_CACHE_SIZE = 100 # сколько страниц /analyze хранить в кэше
+SCRAPER_BACKEND = 'http' # 'http' — лёгкий парсинг m.vk.com с запасным Chromium, 'browser' — только Chromium
+SCRAPER_MOBILE_HOST = 'https://m.vk.com' # откуда загружать мобильную версию страниц альбомов
+SCRAPER_HTTP_CONNECTIONS = 10 # размер пула HTTP-соединений
+SCRAPER_HTTP_TIMEOUT = 15 # таймаут загрузки страницы по HTTP, в секундах
+SCRAPER_USER_AGENT = 'Mozilla/5.0 (Linux; Android 13) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Mobile Safari/537.36'
+SCRAPER_GOTO_TIMEOUT = 20000 # таймаут загрузки страницы в браузере, в миллисекундах
+SCRAPER_SELECTOR_TIMEOUT = 15000 # таймаут ожидания данных альбома на странице, в миллисекундах
+SCRAPER_BLOCKED_RESOURCES = ('image', 'font', 'media') # какие ресурсы не загружать в браузере
+SCRAPER_ALLOWED_HOSTS = ('vk.com', 'vk.ru', 'userapi.com', 'vkuser.net') # хосты, запросы к которым браузер пропускает
+METRICS_HOST = '127.0.0.1' # адрес HTTP-сервера с метриками
+METRICS_PORT = 9108 # порт для /metrics, 0 — не запускать сервер метрик
+JOB_QUEUE_BACKEND = 'sqlite' # очередь задач парсинга: 'sqlite' — таблица jobs в общей базе, 'redis' — сервер Redis
+REDIS_URL = 'redis://localhost:6379/0' # адрес Redis, если JOB_QUEUE_BACKEND = 'redis'
+JOB_MAX_ATTEMPTS = 3 # сколько раз пробовать выполнить задачу
+JOB_LEASE_SECONDS = 120 # на сколько секунд задача закрепляется за обработчиком, пока он не продлит аренду
+JOB_RETRY_BASE_DELAY = 30 # базовая задержка перед повтором задачи, в секундах
+JOB_POLL_INTERVAL = 1 # как часто обработчик проверяет очередь, если она пуста, в секундах
+JOB_NOTIFY_INTERVAL = 2 # как часто бот отправляет пользователям результаты задач, в секундах
+STATS_FLUSH_INTERVAL = 5 # через сколько секунд без новых результатов сохранять неполную пачку статистики
+ALBUM_QUEUE_PER_USER = 5 # сколько ссылок одного пользователя может ждать загрузки одновременно
+ALBUM_JOBS_PER_USER = 1 # сколько альбомов одного пользователя загружается одновременно
+ALBUM_JOBS_GLOBAL = 3 # сколько альбомов по ссылкам пользователей загружается одновременно на всех обработчиках
+BULK_IMPORT_MAX_LINKS = 500 # сколько альбомов можно добавить одним сообщением или файлом
+BULK_IMPORT_MAX_FILE_SIZE = 1024 * 1024 # максимальный размер файла со ссылками, в байтах
+BULK_IMPORT_CONCURRENCY = 5 # сколько альбомов одного импорта парсится одновременно (импорт считается одной задачей в ALBUM_JOBS_PER_USER)
+EMBEDDED_WORKER = True # запускать обработчиков задач внутри бота; False — только отдельным процессом worker.py
+WORKER_METRICS_PORT = 9109 # порт /metrics для отдельного процесса worker.py, 0 — не запускать
+EXPORT_DIR = 'exports' # куда export.py сохраняет выгрузки статистики
+EXPORT_CHUNK_SIZE = 50000 # сколько записей статистики читать и записывать за раз при выгрузке
+ALERT_EWMA_ALPHA = 0.3 # вес нового значения в сглаженном приросте прослушиваний (EWMA)
+ALERT_COOLDOWN_HOURS = 24 # не чаще чем раз в столько часов повторять уведомление о приросте или застое
+ALERTS_PER_SECOND = 20 # сколько уведомлений в секунду отправлять всего
+ALERT_CHAT_INTERVAL = 1 # не чаще чем раз в столько секунд писать в один чат
+ALERTS_BATCH_SIZE = 100 # сколько уведомлений забирать из базы за раз
+ALERT_RETRY_SECONDS = 30 # через сколько секунд повторить уведомление после сетевой ошибки
+TOP_PERIODS = (7, 30, 90) # за сколько дней можно посмотреть рейтинг /top, первый — по умолчанию
+TOP_SIZE = 10 # сколько альбомов показывать в рейтинге /top
+RETENTION_FULL_DAYS = 90 # сколько дней хранить все записи статистики, старше — одну запись в неделю
+RETENTION_WEEKLY_DAYS = 365 # сколько дней хранить записи по неделям, старше — одну запись в месяц
+RETENTION_DAILY_DAYS = 400 # сколько дней хранить прирост по дням (stats_daily), не меньше самого длинного периода TOP_PERIODS
+RETENTION_ALBUMS_PER_STEP = 200 # статистику скольких альбомов прореживать за одну транзакцию
+MAINTENANCE_INTERVAL_MINUTES = 30 # как часто запускать обслуживание базы
+MAINTENANCE_TIME_BUDGET = 2 # сколько секунд может занимать один проход обслуживания
+VACUUM_PAGES_PER_STEP = 256 # сколько свободных страниц возвращать файлу базы за одну транзакцию
+BOT_MODE = 'polling' # как получать апдейты Telegram: 'polling' — опрос getUpdates, 'webhook' — HTTP-сервер webhook.py
+WEBHOOK_URL = '' # публичный адрес бота (https://example.com), который регистрируется в Telegram; пусто — не регистрировать
+WEBHOOK_PATH = '/webhook' # путь, на который Telegram присылает апдейты
+WEBHOOK_HOST = '0.0.0.0' # адрес HTTP-сервера вебхука
+WEBHOOK_PORT = 8080 # порт HTTP-сервера вебхука
+WEBHOOK_SECRET = '' # секрет в заголовке X-Telegram-Bot-Api-Secret-Token, пусто — не проверять
+DROP_PENDING_UPDATES = False # пропускать апдейты, пришедшие, пока бот был остановлен
+UPDATE_CONCURRENCY = 50 # сколько апдейтов обрабатывать одновременно, остальные ждут
+TELEGRAM_CONNECTIONS = 100 # размер пула соединений с Bot API
+TELEGRAM_API_URL = '' # свой сервер Bot API, например http://localhost:8081; пусто — api.telegram.org
+SHUTDOWN_DRAIN_TIMEOUT = 30 # сколько секунд при остановке дорабатывать начатые апдейты и задачи парсинга
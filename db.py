@@ -1,9 +1,46 @@
-from config import DATABASE
+from config import DATABASE, DATA_FILE, REFRESH_INTERVAL_DAYS
+from config import REFRESH_MIN_INTERVAL_HOURS, REFRESH_MAX_INTERVAL_DAYS, REFRESH_FAST_GROWTH, REFRESH_SLOW_GROWTH, REFRESH_JITTER
+from datetime import datetime, timedelta
 import aiosqlite
+import asyncio
+import json
+import logging
+import os
+import random
+from utils import extract_album_id, parse_plays
+from alerts import update_growth, check_alert, alert_due
+from metrics import db_seconds, timed_call
+
+# Интервалы обновления статистики в секундах
+DEFAULT_REFRESH_INTERVAL = REFRESH_INTERVAL_DAYS * 86400
+MIN_REFRESH_INTERVAL = REFRESH_MIN_INTERVAL_HOURS * 3600
+MAX_REFRESH_INTERVAL = REFRESH_MAX_INTERVAL_DAYS * 86400
+
+def next_refresh_interval(interval: int, previous_plays: int | None, plays: int | None, elapsed_days: float) -> int:
+    """Новый интервал обновления: быстро растущие альбомы проверяем чаще, замершие — реже.
+    Прирост считается за время, которое на самом деле прошло с прошлой записи, а не за интервал:
+    после отсрочки или простоя альбом мог не проверяться дольше"""
+    if previous_plays is None or plays is None or elapsed_days <= 0:
+        return interval
+
+    growth_per_day = (plays - previous_plays) / max(previous_plays, 1) / elapsed_days
+    if growth_per_day >= REFRESH_FAST_GROWTH:
+        interval //= 2
+    elif growth_per_day <= REFRESH_SLOW_GROWTH:
+        interval = interval * 3 // 2
+    return min(max(interval, MIN_REFRESH_INTERVAL), MAX_REFRESH_INTERVAL)
+
+def due_after(start: datetime, interval: int) -> str:
+    """Дата следующего обновления со случайным сдвигом, чтобы альбомы не собирались в одну точку"""
+    offset = interval * (1 + random.uniform(-REFRESH_JITTER, REFRESH_JITTER))
+    return (start + timedelta(seconds=offset)).strftime('%Y-%m-%d %H:%M:%S')
 
 async def init_db():
     """Создание таблицы в базе данных"""
     async with aiosqlite.connect(DATABASE) as db:
+        # Освобождённые страницы возвращаются постепенно (maintenance.py). Действует только для новой базы,
+        # существующую нужно один раз перевести командой python maintenance.py --vacuum
+        await db.execute('PRAGMA auto_vacuum = INCREMENTAL')
         await db.execute('''
             CREATE TABLE IF NOT EXISTS albums (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -27,20 +64,737 @@ async def init_db():
             )
         ''')
 
+        # Служебные колонки для планировщика обновлений
+        await add_column(db, 'albums', 'last_update', 'TEXT')   # Дата последнего обновления статистики
+        await add_column(db, 'albums', 'next_due_at', 'TEXT')   # Когда альбом нужно обновить в следующий раз
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_albums_next_due_at ON albums (next_due_at)')
+        # Собственный интервал обновления альбома в секундах, подстраивается под скорость роста прослушиваний
+        spread_schedule = await add_column(db, 'albums', 'refresh_interval', 'INTEGER')
+
+        # Составной индекс покрывает и поиск только по aid, отдельный idx_stats_aid лишь замедлял вставку
+        await db.execute('DROP INDEX IF EXISTS idx_stats_aid')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_stats_aid_date ON stats (aid, date)')
+
+        # Количество прослушиваний числом, чтобы не разбирать строку counts при каждом чтении
+        await add_column(db, 'albums', 'plays', 'INTEGER')
+        await add_column(db, 'stats', 'plays', 'INTEGER')
+        await backfill_plays(db, 'albums')
+        await backfill_plays(db, 'stats')
+
+        # Канонический ключ альбома "owner_id_playlist_id" для поиска дублей
+        await add_column(db, 'albums', 'vk_key', 'TEXT')
+        await backfill_vk_keys(db)
+        await db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_albums_vk_key ON albums (vk_key)')
+
+        await init_search_index(db)
+
+        # Скользящие показатели альбома, обновляются при каждой новой записи статистики без чтения истории
+        backfill_rollups = await add_column(db, 'albums', 'last_plays', 'INTEGER')  # Последнее значение прослушиваний
+        await add_column(db, 'albums', 'last_plays_at', 'TEXT')   # Когда оно получено
+        await add_column(db, 'albums', 'growth_ewma', 'REAL')     # Сглаженный прирост прослушиваний в сутки
+        if backfill_rollups:
+            await db.execute('''
+                UPDATE albums SET
+                    last_plays = COALESCE((SELECT plays FROM stats WHERE aid = albums.id ORDER BY id DESC LIMIT 1), plays),
+                    last_plays_at = COALESCE((SELECT date FROM stats WHERE aid = albums.id ORDER BY id DESC LIMIT 1), date)
+            ''')
+
+        # Прослушивания по дням с приростом за день, обновляются вместе с каждой вставкой в stats
+        async with db.execute("SELECT 1 FROM sqlite_master WHERE name = 'stats_daily'") as cursor:
+            daily_exists = await cursor.fetchone()
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS stats_daily (
+                aid INTEGER NOT NULL,       -- ID альбома
+                day TEXT NOT NULL,          -- Дата YYYY-MM-DD
+                plays INTEGER NOT NULL,     -- Последнее значение прослушиваний за день
+                delta INTEGER NOT NULL,     -- Прирост относительно предыдущего дня с данными
+                PRIMARY KEY (aid, day)
+            ) WITHOUT ROWID
+        ''')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_stats_daily_day ON stats_daily (day, aid, delta)')
+        if not daily_exists:
+            await backfill_stats_daily(db)
+
+        # Подписки пользователей на уведомления и исходящие уведомления для бота
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                album_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,             -- growth, milestone или stall (alerts.py)
+                threshold INTEGER NOT NULL,
+                last_fired_at TEXT,             -- Когда уведомление отправлялось в последний раз
+                created_at TEXT NOT NULL,
+                UNIQUE (chat_id, album_id, kind),
+                FOREIGN KEY (album_id) REFERENCES albums(id)
+            )
+        ''')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_subscriptions_album_id ON subscriptions (album_id)')
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS alert_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        ''')
+
+        # Очередь задач для обработчиков парсинга (jobs.SQLiteQueue)
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,             -- Вид задачи: refresh или new_album
+                payload TEXT NOT NULL,          -- Параметры задачи в JSON
+                dedupe_key TEXT,                -- Ключ против дублей, пока задача не завершена
+                status TEXT NOT NULL DEFAULT 'pending',  -- pending, running, done, failed
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                run_after TEXT NOT NULL,        -- Не раньше этого времени
+                lease_until TEXT,               -- До какого времени задача закреплена за обработчиком
+                worker_id TEXT,
+                result TEXT,
+                error TEXT,
+                created_at TEXT NOT NULL
+            )
+        ''')
+        await db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe_key ON jobs (dedupe_key)')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, run_after)')
+        await add_column(db, 'jobs', 'owner', 'INTEGER')   # Пользователь, отправивший ссылку
+        await add_column(db, 'jobs', 'progress', 'TEXT')   # Текст о ходе выполнения для пользователя
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_owner ON jobs (owner, status)')
+
+        # Вместе с альбомом удаляются его статистика, подписки и ожидающие обновления
+        await db.execute('''
+            CREATE TRIGGER IF NOT EXISTS albums_cascade_delete AFTER DELETE ON albums BEGIN
+                DELETE FROM stats WHERE aid = old.id;
+                DELETE FROM stats_daily WHERE aid = old.id;
+                DELETE FROM subscriptions WHERE album_id = old.id;
+                DELETE FROM jobs WHERE dedupe_key = 'refresh:' || old.id AND status = 'pending';
+            END
+        ''')
+
+        # До какой записи статистики уже выгружены данные (export.py)
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS export_state (
+                name TEXT PRIMARY KEY,          -- Имя выгрузки
+                last_stats_id INTEGER NOT NULL, -- ID последней выгруженной записи stats
+                updated_at TEXT NOT NULL
+            )
+        ''')
+
         await db.commit()
 
-# Функция для очистки базы данных
-async def clear_database():
-    async with aiosqlite.connect(DATABASE) as db:
-        await db.execute("DELETE FROM albums")
+        await migrate_json_state(db)
+
+        # Альбомы без даты следующего обновления обновляем при ближайшем запуске
+        await db.execute("UPDATE albums SET next_due_at = ? WHERE next_due_at IS NULL",
+                         (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+
+        # Раньше все альбомы обновлялись разом; при переходе раскладываем их равномерно по интервалу
+        if spread_schedule:
+            await db.execute('''
+                UPDATE albums SET refresh_interval = ?,
+                    next_due_at = strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime', '+' || ((id * 2654435761) % ?) || ' seconds')
+            ''', (DEFAULT_REFRESH_INTERVAL, DEFAULT_REFRESH_INTERVAL))
         await db.commit()
 
-async def fetchallStats(album_id):
-    async with aiosqlite.connect(DATABASE) as db:
-        async with db.execute('''
-            SELECT counts, date FROM stats
-            WHERE aid = ?
-            ORDER BY date
-        ''', (album_id,)) as cursor:
-            stats = await cursor.fetchall()
-            return stats
+async def init_search_index(db):
+    """Полнотекстовый индекс FTS5 по названию альбома и исполнителю, синхронизируется триггерами"""
+    async with db.execute("SELECT 1 FROM sqlite_master WHERE name = 'albums_fts'") as cursor:
+        exists = await cursor.fetchone()
+
+    await db.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS albums_fts USING fts5(
+            name, nick, content='albums', content_rowid='id', tokenize='unicode61'
+        )
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS albums_fts_insert AFTER INSERT ON albums BEGIN
+            INSERT INTO albums_fts (rowid, name, nick) VALUES (new.id, new.name, new.nick);
+        END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS albums_fts_delete AFTER DELETE ON albums BEGIN
+            INSERT INTO albums_fts (albums_fts, rowid, name, nick) VALUES ('delete', old.id, old.name, old.nick);
+        END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS albums_fts_update AFTER UPDATE OF name, nick ON albums BEGIN
+            INSERT INTO albums_fts (albums_fts, rowid, name, nick) VALUES ('delete', old.id, old.name, old.nick);
+            INSERT INTO albums_fts (rowid, name, nick) VALUES (new.id, new.name, new.nick);
+        END
+    ''')
+
+    # Индекс только что создан — заполняем его уже добавленными альбомами
+    if not exists:
+        await db.execute("INSERT INTO albums_fts (albums_fts) VALUES ('rebuild')")
+
+async def backfill_stats_daily(db):
+    """Заполнение stats_daily по уже накопленной статистике: последнее значение за день и прирост к прошлому дню"""
+    await db.execute('''
+        INSERT INTO stats_daily (aid, day, plays, delta)
+        SELECT aid, day, plays,
+               plays - COALESCE(LAG(plays) OVER (PARTITION BY aid ORDER BY day), (SELECT plays FROM albums WHERE id = aid), plays)
+        FROM (
+            SELECT aid, substr(date, 1, 10) AS day, plays, MAX(date) FROM stats
+            WHERE aid IS NOT NULL AND plays IS NOT NULL
+            GROUP BY aid, day
+        )
+    ''')
+
+async def add_column(db, table, column, declaration):
+    """Добавление колонки в существующую таблицу, если её ещё нет. Возвращает True, если колонка добавлена"""
+    async with db.execute(f'PRAGMA table_info({table})') as cursor:
+        columns = [row[1] for row in await cursor.fetchall()]
+
+    if column not in columns:
+        await db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+        return True
+    return False
+
+async def backfill_plays(db, table, chunk_size=10000):
+    """Заполнение колонки plays для старых записей пачками"""
+    last_id = 0
+    while True:
+        async with db.execute(f'SELECT id, counts FROM {table} WHERE plays IS NULL AND id > ? ORDER BY id LIMIT ?',
+                              (last_id, chunk_size)) as cursor:
+            rows = await cursor.fetchall()
+
+        if not rows:
+            return
+
+        await db.executemany(f'UPDATE {table} SET plays = ? WHERE id = ?', [(parse_plays(counts), row_id) for row_id, counts in rows])
+        last_id = rows[-1][0]
+
+async def backfill_vk_keys(db):
+    """Заполнение vk_key для старых записей. У дублей ключ получает только самый ранний альбом"""
+    async with db.execute('SELECT vk_key FROM albums WHERE vk_key IS NOT NULL') as cursor:
+        seen = {row[0] for row in await cursor.fetchall()}
+
+    async with db.execute('SELECT id, url FROM albums WHERE vk_key IS NULL ORDER BY id') as cursor:
+        albums = await cursor.fetchall()
+
+    rows = []
+    for album_id, url in albums:
+        vk_key = extract_album_id(url or '')
+        if vk_key is None or vk_key in seen:
+            if vk_key is not None:
+                logging.warning(f"Альбом {album_id} дублирует уже добавленный альбом {vk_key}")
+            continue
+        seen.add(vk_key)
+        rows.append((vk_key, album_id))
+
+    await db.executemany('UPDATE albums SET vk_key = ? WHERE id = ?', rows)
+
+async def migrate_json_state(db):
+    """Однократный перенос дат обновления из старого JSON-файла в таблицу albums"""
+    if not os.path.exists(DATA_FILE):
+        return
+
+    with open(DATA_FILE, 'r') as file:
+        data = json.load(file)
+
+    rows = []
+    for album_id, info in data.items():
+        last_update = info.get('last_update')
+        if not last_update:
+            continue
+
+        next_due_at = datetime.strptime(last_update, '%Y-%m-%d %H:%M:%S') + timedelta(days=REFRESH_INTERVAL_DAYS)
+        rows.append((last_update, next_due_at.strftime('%Y-%m-%d %H:%M:%S'), int(album_id)))
+
+    await db.executemany('UPDATE albums SET last_update = ?, next_due_at = ? WHERE id = ?', rows)
+    await db.commit()
+
+    # Переименовываем файл, чтобы миграция не запускалась повторно
+    os.replace(DATA_FILE, DATA_FILE + '.migrated')
+    logging.info(f"Даты обновления {len(rows)} альбомов перенесены из {DATA_FILE} в базу данных")
+
+# Долгоживущие соединения: одно для чтения, одно для задачи-писателя
+_reader = None
+_writer = None
+_write_queue = None
+_writer_task = None
+
+async def _open_connection():
+    """Открытие соединения с настройками для параллельной работы бота и обновления статистики"""
+    conn = await aiosqlite.connect(DATABASE)
+    await conn.execute('PRAGMA journal_mode = WAL')       # Читатели не блокируют писателя
+    await conn.execute('PRAGMA synchronous = NORMAL')     # В режиме WAL это безопасно и намного быстрее FULL
+    await conn.execute('PRAGMA cache_size = -20000')      # ~20 МБ кэша страниц
+    await conn.execute('PRAGMA busy_timeout = 5000')      # Ждём блокировку вместо ошибки "database is locked"
+    await conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+async def connect():
+    """Открытие соединений и запуск задачи-писателя. Вызывается один раз при старте"""
+    global _reader, _writer, _write_queue, _writer_task
+    if _writer is not None:
+        return
+
+    _writer = await _open_connection()
+    _reader = await _open_connection()
+    _write_queue = asyncio.Queue()
+    _writer_task = asyncio.create_task(_writer_loop())
+
+async def close():
+    """Дожидаемся всех записей и закрываем соединения"""
+    global _reader, _writer, _write_queue, _writer_task
+    if _writer is None:
+        return
+
+    await _write_queue.put((None, None))
+    await _writer_task
+    await _reader.close()
+    await _writer.close()
+    _reader = _writer = _write_queue = _writer_task = None
+
+async def _writer_loop():
+    """Все записи в базу выполняются здесь по очереди, каждая — отдельной транзакцией"""
+    while True:
+        func, future = await _write_queue.get()
+        if func is None:
+            return
+
+        try:
+            result = await func(_writer)
+            await _writer.commit()
+        except Exception as e:
+            await _writer.rollback()
+            if not future.cancelled():
+                future.set_exception(e)
+        else:
+            if not future.cancelled():
+                future.set_result(result)
+
+async def write(func):
+    """Передаёт func(conn) задаче-писателю и возвращает её результат после коммита"""
+    if _writer is None:
+        await connect()
+
+    future = asyncio.get_running_loop().create_future()
+    await _write_queue.put((func, future))
+    return await future
+
+async def fetchall(query: str, params: tuple = ()) -> list:
+    if _reader is None:
+        await connect()
+
+    async with _reader.execute(query, params) as cursor:
+        return await cursor.fetchall()
+
+async def fetchone(query: str, params: tuple = ()):
+    if _reader is None:
+        await connect()
+
+    async with _reader.execute(query, params) as cursor:
+        return await cursor.fetchone()
+
+# Функция для очистки базы данных
+@timed_call(db_seconds)
+async def clear_database() -> None:
+    async def _clear(conn):
+        # Статистику и подписки удаляет триггер albums_cascade_delete
+        await conn.execute("DELETE FROM albums")
+
+    await write(_clear)
+
+@timed_call(db_seconds)
+async def fetchallStats(album_id: int) -> tuple[list[datetime], list[int]]:
+    """Статистика альбома, готовая для графика: список дат и список прослушиваний"""
+    rows = await fetchall('''
+        SELECT date, plays FROM stats
+        WHERE aid = ?
+        ORDER BY date
+    ''', (album_id,))
+
+    dates = [datetime.strptime(date[:10], '%Y-%m-%d') for date, _ in rows]
+    plays = [count or 0 for _, count in rows]
+    return dates, plays
+
+# Группировка статистики по периодам для графиков
+BUCKET_FORMATS = {
+    'day': '%Y-%m-%d',
+    'week': '%Y-%W',
+    'month': '%Y-%m',
+}
+
+async def iter_stats_buckets(album_id: int, since: str = '', until: str = '9999-12-31', bucket: str = 'day',
+                             agg: str = 'last', limit: int = 100):
+    """Последние limit точек статистики альбома за период [since, until), по одной на день/неделю/месяц.
+    agg='last' — последнее значение в периоде, agg='max' — максимальное. Группировка выполняется в SQLite,
+    строки читаются из курсора по мере итерации: (дата, прослушивания)"""
+    if bucket not in BUCKET_FORMATS:
+        raise ValueError(f"Неизвестный период группировки: {bucket}")
+    if agg not in ('last', 'max'):
+        raise ValueError(f"Неизвестная агрегация: {agg}")
+
+    if _reader is None:
+        await connect()
+
+    # При MAX(date) SQLite берёт остальные колонки из той же строки — это и есть последнее значение
+    plays_column = 'plays' if agg == 'last' else 'MAX(plays)'
+    query = f'''
+        SELECT date, plays FROM (
+            SELECT MAX(date) AS date, {plays_column} AS plays FROM stats
+            WHERE aid = ? AND date >= ? AND date < ?
+            GROUP BY strftime(?, date)
+            ORDER BY date DESC
+            LIMIT ?
+        )
+        ORDER BY date
+    '''
+
+    async with _reader.execute(query, (album_id, since, until, BUCKET_FORMATS[bucket], limit)) as cursor:
+        async for date, plays in cursor:
+            yield datetime.strptime(date[:10], '%Y-%m-%d'), plays or 0
+
+async def iter_stats_export(after_id: int, until_id: int, chunk_size: int):
+    """Записи статистики с данными альбома для выгрузки, пачками по chunk_size строк в порядке ID:
+    (stats_id, album_id, vk_key, название, исполнитель, прослушивания, counts, дата)"""
+    while after_id < until_id:
+        rows = await fetchall('''
+            SELECT s.id, s.aid, a.vk_key, a.name, a.nick, s.plays, s.counts, s.date
+            FROM stats s LEFT JOIN albums a ON a.id = s.aid
+            WHERE s.id > ? AND s.id <= ?
+            ORDER BY s.id
+            LIMIT ?
+        ''', (after_id, until_id, chunk_size))
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+
+@timed_call(db_seconds)
+async def top_growth(since: str, limit: int) -> list[tuple[int, str, str, int]]:
+    """Альбомы с наибольшим приростом прослушиваний начиная с дня since: (id, название, исполнитель, прирост)"""
+    return await fetchall('''
+        SELECT d.aid, a.name, a.nick, SUM(d.delta) AS growth
+        FROM stats_daily d JOIN albums a ON a.id = d.aid
+        WHERE d.day >= ?
+        GROUP BY d.aid
+        ORDER BY growth DESC
+        LIMIT ?
+    ''', (since, limit))
+
+@timed_call(db_seconds)
+async def max_stats_aid() -> int:
+    row = await fetchone('SELECT MAX(aid) FROM stats')
+    return row[0] or 0
+
+@timed_call(db_seconds)
+async def compact_stats(after_aid: int, until_aid: int, full_since: str, weekly_since: str, daily_since: str) -> int:
+    """Прореживание статистики альбомов с ID в (after_aid, until_aid]: записи новее full_since остаются все,
+    от weekly_since до full_since — последняя за неделю, ещё старше — последняя за месяц.
+    Заодно удаляются записи удалённых альбомов и дни stats_daily старше daily_since. Возвращает число удалённых записей"""
+    async def _compact(conn):
+        cursor = await conn.execute('''
+            DELETE FROM stats
+            WHERE aid > ?1 AND aid <= ?2
+              AND aid NOT IN (SELECT id FROM albums WHERE id > ?1 AND id <= ?2)
+        ''', (after_aid, until_aid))
+        deleted = cursor.rowcount
+
+        # Из каждой недели или месяца остаётся запись с наибольшей датой
+        cursor = await conn.execute('''
+            DELETE FROM stats
+            WHERE aid > ?1 AND aid <= ?2 AND date < ?3
+              AND id NOT IN (
+                  SELECT id FROM (
+                      SELECT id, MAX(date) FROM stats
+                      WHERE aid > ?1 AND aid <= ?2 AND date < ?3
+                      GROUP BY aid, CASE WHEN date >= ?4 THEN strftime('%Y-%W', date) ELSE strftime('%Y-%m', date) END
+                  )
+              )
+        ''', (after_aid, until_aid, full_since, weekly_since))
+        deleted += cursor.rowcount
+
+        await conn.execute('''
+            DELETE FROM stats_daily
+            WHERE aid > ?1 AND aid <= ?2
+              AND (day < ?3 OR aid NOT IN (SELECT id FROM albums WHERE id > ?1 AND id <= ?2))
+        ''', (after_aid, until_aid, daily_since))
+        return deleted
+
+    return await write(_compact)
+
+async def incremental_vacuum(pages: int) -> int | None:
+    """Возврат до pages свободных страниц файлу базы. Возвращает, сколько свободных страниц осталось,
+    или None, если база не в режиме auto_vacuum = INCREMENTAL"""
+    async def _vacuum(conn):
+        async with conn.execute('PRAGMA auto_vacuum') as cursor:
+            if (await cursor.fetchone())[0] != 2:
+                return None
+        # Страницы освобождаются по одной на каждый шаг запроса, поэтому результат нужно дочитать
+        async with conn.execute(f'PRAGMA incremental_vacuum({int(pages)})') as cursor:
+            await cursor.fetchall()
+        async with conn.execute('PRAGMA freelist_count') as cursor:
+            return (await cursor.fetchone())[0]
+
+    return await write(_vacuum)
+
+async def optimize() -> None:
+    """Обновление статистики планировщика запросов SQLite по таблицам, где она устарела"""
+    async def _optimize(conn):
+        await conn.execute('PRAGMA optimize')
+
+    await write(_optimize)
+
+async def vacuum() -> None:
+    """Полная пересборка файла базы с переводом в режим auto_vacuum = INCREMENTAL.
+    Блокирует базу на всё время работы, запускать только при остановленном боте"""
+    if _writer is not None:
+        raise RuntimeError("VACUUM нельзя выполнять через общие соединения")
+
+    async with aiosqlite.connect(DATABASE) as conn:
+        await conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        await conn.execute('VACUUM')
+
+@timed_call(db_seconds)
+async def max_stats_id() -> int:
+    row = await fetchone('SELECT MAX(id) FROM stats')
+    return row[0] or 0
+
+@timed_call(db_seconds)
+async def get_export_mark(name: str) -> int:
+    """ID последней выгруженной записи статистики, 0 — выгрузок ещё не было"""
+    row = await fetchone('SELECT last_stats_id FROM export_state WHERE name = ?', (name,))
+    return row[0] if row else 0
+
+@timed_call(db_seconds)
+async def set_export_mark(name: str, last_stats_id: int, updated_at: str) -> None:
+    await write(lambda conn: conn.execute('''
+        INSERT INTO export_state (name, last_stats_id, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET last_stats_id = excluded.last_stats_id, updated_at = excluded.updated_at
+    ''', (name, last_stats_id, updated_at)))
+
+@timed_call(db_seconds)
+async def last_stats_id(album_id: int) -> int | None:
+    """ID последней записи статистики альбома — меняется, только когда появились новые данные"""
+    row = await fetchone('SELECT MAX(id) FROM stats WHERE aid = ?', (album_id,))
+    return row[0]
+
+@timed_call(db_seconds)
+async def albums_page(after_id: int | None = None, before_id: int | None = None,
+                      limit: int = 10) -> tuple[list[tuple[int, str, str]], bool, bool]:
+    """Страница альбомов по ключу id (после after_id или перед before_id).
+    Возвращает (альбомы, есть ли предыдущая страница, есть ли следующая)"""
+    if before_id is not None:
+        rows = await fetchall('SELECT id, name, nick FROM albums WHERE id < ? ORDER BY id DESC LIMIT ?', (before_id, limit + 1))
+        has_prev = len(rows) > limit
+        rows = rows[:limit][::-1]
+        has_next = bool(rows)
+    else:
+        rows = await fetchall('SELECT id, name, nick FROM albums WHERE id > ? ORDER BY id LIMIT ?', (after_id or 0, limit + 1))
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+        has_prev = bool(rows) and await fetchone('SELECT 1 FROM albums WHERE id < ? LIMIT 1', (rows[0][0],)) is not None
+    return rows, has_prev, has_next
+
+@timed_call(db_seconds)
+async def search_albums(query: str, limit: int = 10) -> list[tuple[int, str, str]]:
+    """Поиск альбомов по началу слов в названии и имени исполнителя"""
+    words = [word.replace('"', '') for word in query.split()]
+    match = ' '.join(f'"{word}"*' for word in words if word)
+    if not match:
+        return []
+
+    return await fetchall('''
+        SELECT albums.id, albums.name, albums.nick FROM albums_fts
+        JOIN albums ON albums.id = albums_fts.rowid
+        WHERE albums_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    ''', (match, limit))
+
+@timed_call(db_seconds)
+async def get_album(album_id: int) -> tuple | None:
+    """Информация об альбоме: название, исполнитель, жанр и год, прослушивания, треки, дата добавления"""
+    return await fetchone('SELECT name, nick, genre_year, counts, track_count, date FROM albums WHERE id = ?', (album_id,))
+
+@timed_call(db_seconds)
+async def find_album(vk_key: str) -> tuple | None:
+    """Поиск уже добавленного альбома по ключу vk_key"""
+    return await fetchone('SELECT id FROM albums WHERE vk_key = ?', (vk_key,))
+
+# Обновление дневной сводки одной записью статистики: прирост считается к последнему предыдущему дню
+# (или к прослушиваниям при добавлении альбома), повторная запись за тот же день поправляет прирост
+STATS_DAILY_UPSERT_SQL = '''
+    INSERT INTO stats_daily (aid, day, plays, delta)
+    VALUES (?1, ?2, ?3, ?3 - COALESCE(
+        (SELECT plays FROM stats_daily WHERE aid = ?1 AND day < ?2 ORDER BY day DESC LIMIT 1),
+        (SELECT plays FROM albums WHERE id = ?1),
+        ?3))
+    ON CONFLICT (aid, day) DO UPDATE SET delta = delta + excluded.plays - plays, plays = excluded.plays
+'''
+
+ALBUM_INSERT_SQL = '''
+    INSERT INTO albums (vk_key, url, name, nick, genre_year, counts, plays, track_count, date, next_due_at, refresh_interval,
+                        last_plays, last_plays_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT DO NOTHING
+'''
+
+def _album_row(vk_key, url, name, nick, genre_year, counts, track_count, date):
+    next_due_at = due_after(datetime.strptime(date, '%Y-%m-%d %H:%M:%S'), DEFAULT_REFRESH_INTERVAL)
+    plays = parse_plays(counts)
+    return (vk_key, url, name, nick, genre_year, counts, plays, track_count, date, next_due_at, DEFAULT_REFRESH_INTERVAL,
+            plays, date)
+
+@timed_call(db_seconds)
+async def insert_album(vk_key: str, url: str, name: str, nick: str, genre_year: str, counts: str, track_count: str, date: str) -> int | None:
+    """Добавление альбома, возвращает его ID или None, если такой альбом уже есть"""
+    async def _insert(conn):
+        cursor = await conn.execute(ALBUM_INSERT_SQL, _album_row(vk_key, url, name, nick, genre_year, counts, track_count, date))
+        return cursor.lastrowid if cursor.rowcount else None
+
+    return await write(_insert)
+
+@timed_call(db_seconds)
+async def insert_albums(rows: list[tuple[str, str, str, str, str, str, str, str]]) -> int:
+    """Добавление пачки альбомов (vk_key, url, name, nick, genre_year, counts, track_count, date) одной транзакцией.
+    Возвращает, сколько альбомов добавлено; уже существующие пропускаются"""
+    if not rows:
+        return 0
+
+    async def _insert(conn):
+        # rowcount, а не total_changes: в total_changes попадают и вставки триггеров полнотекстового индекса
+        cursor = await conn.executemany(ALBUM_INSERT_SQL, [_album_row(*row) for row in rows])
+        return cursor.rowcount
+
+    return await write(_insert)
+
+@timed_call(db_seconds)
+async def existing_vk_keys(vk_keys: list[str]) -> set[str]:
+    """Какие из ключей уже есть в базе — одним запросом для любого количества ключей"""
+    rows = await fetchall('SELECT vk_key FROM albums WHERE vk_key IN (SELECT value FROM json_each(?))', (json.dumps(vk_keys),))
+    return {vk_key for vk_key, in rows}
+
+@timed_call(db_seconds)
+async def fetch_due_albums(now: str, limit: int) -> list[tuple[int, str, str]]:
+    """Альбомы, которым пора обновиться: (id, url, next_due_at), самые просроченные первыми"""
+    return await fetchall('''
+        SELECT id, url, next_due_at FROM albums
+        WHERE next_due_at <= ?
+        ORDER BY next_due_at, id
+        LIMIT ?
+    ''', (now, limit))
+
+@timed_call(db_seconds)
+async def postpone_refresh(album_ids: list[int], seconds: int | None = None) -> None:
+    """Сдвиг следующего обновления альбомов на seconds секунд от текущего момента,
+    без seconds — на удвоенный интервал альбома (после окончательной ошибки парсинга)"""
+    async def _postpone(conn):
+        async with conn.execute('SELECT id, refresh_interval FROM albums WHERE id IN (SELECT value FROM json_each(?))',
+                                (json.dumps(album_ids),)) as cursor:
+            rows = await cursor.fetchall()
+
+        now = datetime.now()
+        await conn.executemany('UPDATE albums SET next_due_at = ? WHERE id = ?', [
+            (due_after(now, seconds or min(2 * (interval or DEFAULT_REFRESH_INTERVAL), MAX_REFRESH_INTERVAL)), album_id)
+            for album_id, interval in rows
+        ])
+
+    await write(_postpone)
+
+@timed_call(db_seconds)
+async def save_stats_batch(batch: list[tuple[int, str]], last_update: str) -> None:
+    """Сохраняет пачку (aid, counts) одной транзакцией: записи статистики, скользящие показатели альбомов,
+    интервалы и даты следующего обновления, уведомления подписчикам"""
+    rows = [(album_id, counts, parse_plays(counts)) for album_id, counts in batch]
+    now = datetime.strptime(last_update, '%Y-%m-%d %H:%M:%S')
+    album_ids = [album_id for album_id, _, _ in rows]
+    placeholders = ','.join('?' * len(rows))
+
+    async def _save(conn):
+        # Прошлое значение и сглаженный прирост хранятся в самой строке альбома — историю не читаем
+        cursor = await conn.execute(f'''
+            SELECT id, name, refresh_interval, COALESCE(last_plays, plays), COALESCE(last_plays_at, date), growth_ewma
+            FROM albums WHERE id IN ({placeholders})
+        ''', album_ids)
+        albums = {row[0]: row[1:] for row in await cursor.fetchall()}
+
+        cursor = await conn.execute(f'''
+            SELECT id, chat_id, album_id, kind, threshold, last_fired_at FROM subscriptions WHERE album_id IN ({placeholders})
+        ''', album_ids)
+        subscriptions = {}
+        for subscription in await cursor.fetchall():
+            subscriptions.setdefault(subscription[2], []).append(subscription)
+
+        schedule, alerts, fired = [], [], []
+        for album_id, _, plays in rows:
+            if album_id not in albums:
+                continue
+            name, interval, previous_plays, previous_at, ewma = albums[album_id]
+
+            elapsed_days = (now - datetime.fromisoformat(previous_at)).total_seconds() / 86400 if previous_at else 0
+            growth, ewma = update_growth(ewma, previous_plays, plays, elapsed_days)
+            interval = next_refresh_interval(interval or DEFAULT_REFRESH_INTERVAL, previous_plays, plays, elapsed_days)
+            schedule.append((last_update, due_after(now, interval), interval, plays, last_update, ewma, album_id))
+
+            for subscription_id, chat_id, _, kind, threshold, last_fired_at in subscriptions.get(album_id, ()):
+                text = check_alert(kind, threshold, name, previous_plays, plays, growth, ewma)
+                if text and alert_due(kind, last_fired_at, now):
+                    alerts.append((chat_id, text, last_update))
+                    fired.append((last_update, subscription_id))
+
+        # Дата записи — то же местное время, что и день в stats_daily, а не CURRENT_TIMESTAMP в UTC
+        await conn.executemany('INSERT INTO stats (aid, counts, plays, date) VALUES (?, ?, ?, ?)',
+                               [(album_id, counts, plays, last_update) for album_id, counts, plays in rows])
+        await conn.executemany(STATS_DAILY_UPSERT_SQL, [(album_id, last_update[:10], plays) for album_id, _, plays in rows])
+        await conn.executemany('''
+            UPDATE albums SET last_update = ?, next_due_at = ?, refresh_interval = ?, last_plays = ?, last_plays_at = ?, growth_ewma = ?
+            WHERE id = ?
+        ''', schedule)
+        await conn.executemany('INSERT INTO alert_outbox (chat_id, text, created_at) VALUES (?, ?, ?)', alerts)
+        await conn.executemany('UPDATE subscriptions SET last_fired_at = ? WHERE id = ?', fired)
+
+    await write(_save)
+
+@timed_call(db_seconds)
+async def add_subscription(chat_id: int, album_id: int, kind: str, threshold: int) -> None:
+    """Подписка на уведомление; повторная подписка того же вида меняет порог"""
+    await write(lambda conn: conn.execute('''
+        INSERT INTO subscriptions (chat_id, album_id, kind, threshold, created_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (chat_id, album_id, kind) DO UPDATE SET threshold = excluded.threshold, last_fired_at = NULL
+    ''', (chat_id, album_id, kind, threshold, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))))
+
+@timed_call(db_seconds)
+async def list_subscriptions(chat_id: int) -> list[tuple[int, int, str, str, int]]:
+    """Подписки чата: (id подписки, id альбома, название альбома, вид, порог)"""
+    return await fetchall('''
+        SELECT s.id, s.album_id, a.name, s.kind, s.threshold
+        FROM subscriptions s JOIN albums a ON a.id = s.album_id
+        WHERE s.chat_id = ?
+        ORDER BY s.id
+    ''', (chat_id,))
+
+@timed_call(db_seconds)
+async def delete_subscription(chat_id: int, subscription_id: int) -> bool:
+    async def _delete(conn):
+        cursor = await conn.execute('DELETE FROM subscriptions WHERE id = ? AND chat_id = ?', (subscription_id, chat_id))
+        return cursor.rowcount > 0
+
+    return await write(_delete)
+
+@timed_call(db_seconds)
+async def fetch_alerts(after_id: int, limit: int) -> list[tuple[int, int, str]]:
+    """До limit неотправленных уведомлений после after_id: (id, chat_id, текст)"""
+    return await fetchall('SELECT id, chat_id, text FROM alert_outbox WHERE id > ? ORDER BY id LIMIT ?', (after_id, limit))
+
+@timed_call(db_seconds)
+async def delete_alerts(alert_ids: list[int]) -> None:
+    """Удаление отправленных уведомлений"""
+    if alert_ids:
+        await write(lambda conn: conn.executemany('DELETE FROM alert_outbox WHERE id = ?', [(alert_id,) for alert_id in alert_ids]))
+
+@timed_call(db_seconds)
+async def insert_stats(rows: list[tuple[int, str, str]]) -> None:
+    """Вставка готовых записей статистики (aid, counts, date)"""
+    rows = [(album_id, counts, parse_plays(counts), date) for album_id, counts, date in rows]
+
+    async def _insert(conn):
+        await conn.executemany("INSERT INTO stats (aid, counts, plays, date) VALUES (?, ?, ?, ?)", rows)
+        await conn.executemany(STATS_DAILY_UPSERT_SQL, [(album_id, date[:10], plays) for album_id, _, plays, date in rows])
+
+    await write(_insert)
@@ -0,0 +1,141 @@
+"""Выгрузка истории прослушиваний для офлайн-анализа: stats вместе с данными альбомов, по частям.
+
+Каждый запуск выгружает только новые записи (после сохранённой в базе отметки) в отдельный файл:
+Parquet или Arrow IPC, если установлен pyarrow (pip install pyarrow), иначе CSV со сжатием gzip.
+Данные читаются и пишутся пачками по EXPORT_CHUNK_SIZE строк, так что память не зависит от размера истории.
+
+    python export.py --format parquet --output-dir exports
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import logging
+import os
+from datetime import datetime
+import config
+import db
+from utils import parse_plays
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+COLUMNS = ('stats_id', 'album_id', 'vk_key', 'album', 'artist', 'plays', 'counts', 'date')
+
+EXTENSIONS = {'parquet': 'parquet', 'arrow': 'arrow', 'csv': 'csv.gz'}
+
+
+def _schema():
+    return pa.schema([
+        ('stats_id', pa.int64()),
+        ('album_id', pa.int64()),
+        ('vk_key', pa.string()),
+        ('album', pa.string()),
+        ('artist', pa.string()),
+        ('plays', pa.int64()),
+        ('counts', pa.string()),
+        ('date', pa.timestamp('s')),
+    ])
+
+
+def _typed(rows):
+    """Числовые прослушивания (старые записи без plays разбираются из counts) и даты вместо строк"""
+    for stats_id, album_id, vk_key, name, nick, plays, counts, date in rows:
+        yield (stats_id, album_id, vk_key, name, nick, plays if plays is not None else parse_plays(counts), counts,
+               datetime.fromisoformat(date) if date else None)
+
+
+class ArrowWriter:
+    """Запись пачек в Parquet (одна группа строк на пачку) или в поток Arrow IPC"""
+
+    def __init__(self, path, fmt):
+        self.schema = _schema()
+        if fmt == 'parquet':
+            self.writer = pa.parquet.ParquetWriter(path, self.schema, compression='zstd')
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+
+    def write(self, rows):
+        columns = list(zip(*_typed(rows)))
+        self.writer.write_table(pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, self.schema)], schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class CsvWriter:
+    """Запасной вариант без pyarrow: CSV, сжатый gzip, даты в ISO 8601"""
+
+    def __init__(self, path, fmt):
+        self.file = gzip.open(path, 'wt', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(row[:-1] + (row[-1].isoformat() if row[-1] else '',) for row in _typed(rows))
+
+    def close(self):
+        self.file.close()
+
+
+async def export_stats(output_dir, fmt='auto', name='stats', full=False, chunk_size=None):
+    """Выгрузка новых записей статистики в файл. Возвращает путь к файлу или None, если новых записей нет"""
+    if fmt == 'auto':
+        fmt = 'parquet' if pa is not None else 'csv'
+    if fmt in ('parquet', 'arrow') and pa is None:
+        raise RuntimeError("Для Parquet и Arrow нужен pyarrow: pip install pyarrow")
+    chunk_size = chunk_size or config.EXPORT_CHUNK_SIZE
+
+    # Верхняя граница фиксируется заранее: записи, добавленные во время выгрузки, попадут в следующую
+    after_id = 0 if full else await db.get_export_mark(name)
+    until_id = await db.max_stats_id()
+    if until_id <= after_id:
+        logging.info(f"Выгрузка {name}: новых записей нет")
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f'{name}_{after_id + 1}_{until_id}.{EXTENSIONS[fmt]}')
+    tmp_path = path + '.tmp'
+
+    writer = (CsvWriter if fmt == 'csv' else ArrowWriter)(tmp_path, fmt)
+    total = 0
+    try:
+        async for rows in db.iter_stats_export(after_id, until_id, chunk_size):
+            writer.write(rows)
+            total += len(rows)
+    finally:
+        writer.close()
+
+    # Отметку сдвигаем только после того, как файл полностью записан
+    os.replace(tmp_path, path)
+    await db.set_export_mark(name, until_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    logging.info(f"Выгрузка {name}: {total} записей в {path}")
+    return path
+
+
+async def main(args):
+    await db.init_db()
+    await db.connect()
+    try:
+        path = await export_stats(args.output_dir, args.format, args.name, args.full, args.chunk_size)
+        if path:
+            print(path)
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Выгрузка статистики прослушиваний в Parquet, Arrow или CSV")
+    parser.add_argument('--format', choices=('auto', 'parquet', 'arrow', 'csv'), default='auto',
+                        help="формат файла; auto — Parquet, если установлен pyarrow, иначе csv.gz")
+    parser.add_argument('--output-dir', default=config.EXPORT_DIR, help="папка для файлов выгрузки")
+    parser.add_argument('--name', default='stats', help="имя выгрузки, у каждого имени своя отметка")
+    parser.add_argument('--full', action='store_true', help="выгрузить всю историю, а не только новые записи")
+    parser.add_argument('--chunk-size', type=int, help="сколько строк читать и записывать за раз")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,478 @@
+"""Обработчики команд, ссылок на альбомы и кнопок бота. Подключаются к диспетчеру в go.py через router"""
+from aiogram import F, Router, types
+from aiogram.filters import Command
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Chat, User, Message
+from aiogram.types import BufferedInputFile, InputMediaPhoto
+from aiogram.types import BotCommand
+from datetime import datetime, timedelta
+import asyncio
+from collections import OrderedDict
+import logging
+import config
+import db
+from db import clear_database
+import charts
+import jobs
+import alerts
+from metrics import stats_chart_seconds
+from utils import is_valid_album_url, extract_album_id, extract_album_urls
+
+router = Router()
+
+# Готовые клавиатуры страниц /analyze, сбрасываются при добавлении альбома
+keyboard_cache = OrderedDict()
+
+# Рейтинги /top по периоду: (ID последней записи статистики, текст), сбрасываются с новой статистикой
+top_cache = {}
+
+# file_id отправленных графиков по ключу (ID альбома, ID последней записи статистики)
+chart_cache = OrderedDict()
+
+# Функция для установки команд в меню
+async def set_bot_commands(bot):
+    commands = [
+        BotCommand(command="start", description="Начать работу с ботом"),
+        BotCommand(command="analyze", description="Показать все добавленные альбомы"),
+        BotCommand(command="search", description="Найти альбом по названию или исполнителю"),
+        BotCommand(command="top", description="Самые быстрорастущие альбомы"),
+        BotCommand(command="alerts", description="Мои уведомления об альбомах"),
+        BotCommand(command="help", description="Помощь по боту")
+    ]
+    await bot.set_my_commands(commands)
+
+# Обработчик команды /start
+@router.message(Command("start"))
+async def start_command(message: types.Message):
+    await message.answer("👋 Привет!\n\n🔗 Отправь мне ссылку на альбом VK и я начну собирать по нему статистику прослушиваний!")
+
+# Обработчик команды /test
+@router.message(Command("test"))
+async def test_command(message: types.Message):
+    if config.TEST_MODE == 1:
+        await clear_database()
+        keyboard_cache.clear()
+        await send_test_messages(message.bot, message.chat.id)
+
+# Команда /analyze
+@router.message(Command("analyze"))
+async def analyze_albums(message: types.Message):
+    # Показываем первую страницу альбомов
+    inline_kb = await get_albums_page_keyboard(after_id=0)
+
+    # Если в базе данных нет альбомов
+    if inline_kb is None:
+        await message.answer("🧺 В базе данных пока нет добавленных альбомов.")
+        return
+
+    # Отправляем пользователю список альбомов
+    await message.answer("🔀 Выберите альбом для просмотра информации", reply_markup=inline_kb)
+
+# Переключение страниц списка альбомов
+@router.callback_query(lambda callback_query: callback_query.data.startswith(("albums_next_", "albums_prev_")))
+async def albums_page(callback_query: types.CallbackQuery):
+    _, direction, album_id = callback_query.data.split("_")
+
+    if direction == "next":
+        inline_kb = await get_albums_page_keyboard(after_id=int(album_id))
+    else:
+        inline_kb = await get_albums_page_keyboard(before_id=int(album_id))
+
+    if inline_kb is not None:
+        try:
+            await callback_query.message.edit_reply_markup(reply_markup=inline_kb)
+        except Exception:
+            pass
+    await callback_query.answer()
+
+# Команда /top — альбомы с наибольшим приростом прослушиваний
+@router.message(Command("top"))
+async def top_command(message: types.Message):
+    arg = message.text.partition(" ")[2].strip()
+    days = int(arg) if arg.isdigit() and int(arg) in config.TOP_PERIODS else config.TOP_PERIODS[0]
+    text, inline_kb = await get_top(days)
+    await message.answer(text, reply_markup=inline_kb, parse_mode='HTML')
+
+# Переключение периода рейтинга
+@router.callback_query(lambda callback_query: callback_query.data.startswith("top_"))
+async def top_period(callback_query: types.CallbackQuery):
+    text, inline_kb = await get_top(int(callback_query.data.split("_")[1]))
+    try:
+        await callback_query.message.edit_text(text, reply_markup=inline_kb, parse_mode='HTML')
+    except Exception:
+        pass
+    await callback_query.answer()
+
+async def get_top(days):
+    """Текст рейтинга за days дней и кнопки периодов. Рейтинг пересчитывается, только когда в базе появилась новая статистика"""
+    version = await db.max_stats_id()
+    cached = top_cache.get(days)
+    if cached is None or cached[0] != version:
+        since = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        albums = await db.top_growth(since, config.TOP_SIZE)
+        if albums:
+            lines = [f"{place}. <b>{name}</b> — {nick}: +{growth:,} (ID {album_id})".replace(',', ' ')
+                     for place, (album_id, name, nick, growth) in enumerate(albums, 1)]
+            text = f"🚀 <b>Самый большой прирост прослушиваний за {days} дн.</b>\n\n" + "\n".join(lines)
+        else:
+            text = f"🧺 За {days} дн. ещё нет данных о приросте прослушиваний."
+        cached = top_cache[days] = (version, text)
+
+    inline_kb = InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text=f"{'• ' if period == days else ''}{period} дн.", callback_data=f"top_{period}")
+        for period in config.TOP_PERIODS
+    ]])
+    return cached[1], inline_kb
+
+# Виды подписок для команды /alert: английские и русские названия
+ALERT_KINDS = {
+    "growth": alerts.GROWTH, "прирост": alerts.GROWTH,
+    "milestone": alerts.MILESTONE, "отметка": alerts.MILESTONE,
+    "stall": alerts.STALL, "застой": alerts.STALL,
+}
+
+def alert_help(album_id="<ID>"):
+    return ("🔔 <b>Уведомления об альбоме</b>\n\n"
+            f"/alert {album_id} прирост 1000 — прирост от 1000 прослушиваний в сутки\n"
+            f"/alert {album_id} отметка 1000000 — альбом набрал 1 000 000 прослушиваний\n"
+            f"/alert {album_id} застой 10 — в среднем меньше 10 прослушиваний в сутки\n\n"
+            "📋 Список подписок: /alerts")
+
+# Команда /alert — подписка на уведомления об альбоме
+@router.message(Command("alert"))
+async def alert_command(message: types.Message):
+    args = message.text.split()[1:]
+    if len(args) != 3 or not args[0].isdigit() or args[1].lower() not in ALERT_KINDS or not args[2].isdigit():
+        await message.answer(alert_help(), parse_mode='HTML')
+        return
+
+    album_id, kind, threshold = int(args[0]), ALERT_KINDS[args[1].lower()], int(args[2])
+    album = await db.get_album(album_id)
+    if not album:
+        await message.answer("❌ Информация об альбоме не найдена.")
+        return
+
+    await db.add_subscription(message.chat.id, album_id, kind, threshold)
+    await message.answer(f"🔔 Подписка оформлена: «{album[0]}», {alerts.KINDS[kind]} {threshold}.\n\n📋 Все подписки: /alerts")
+
+# Команда /alerts — список подписок
+@router.message(Command("alerts"))
+async def alerts_command(message: types.Message):
+    subscriptions = await db.list_subscriptions(message.chat.id)
+    if not subscriptions:
+        await message.answer("🔕 У вас пока нет подписок.\n\n" + alert_help(), parse_mode='HTML')
+        return
+
+    lines = [f"{subscription_id}. «{name}» (ID {album_id}): {alerts.KINDS[kind]} {threshold} — /unalert_{subscription_id}"
+             for subscription_id, album_id, name, kind, threshold in subscriptions]
+    await message.answer("🔔 Ваши подписки:\n\n" + "\n".join(lines))
+
+# Отписка: /unalert_<номер подписки>
+@router.message(lambda message: message.text and message.text.startswith("/unalert_"))
+async def unalert_command(message: types.Message):
+    subscription_id = message.text.split("_", 1)[1].split("@")[0]
+    if subscription_id.isdigit() and await db.delete_subscription(message.chat.id, int(subscription_id)):
+        await message.answer("🔕 Подписка удалена.")
+    else:
+        await message.answer("❌ Подписка не найдена.")
+
+# Подсказка по уведомлениям из карточки альбома
+@router.callback_query(lambda callback_query: callback_query.data.startswith("alerts_"))
+async def album_alerts(callback_query: types.CallbackQuery):
+    await callback_query.message.answer(alert_help(callback_query.data.split("_")[1]), parse_mode='HTML')
+    await callback_query.answer()
+
+# Команда /search — поиск альбома по названию или исполнителю
+@router.message(Command("search"))
+async def search_albums(message: types.Message):
+    query = message.text.partition(" ")[2].strip()
+    if not query:
+        await message.answer("🔎 Напишите название альбома или исполнителя после команды, например:\n/search Мот")
+        return
+
+    albums = await db.search_albums(query, config.ALBUMS_PAGE_SIZE)
+    if not albums:
+        await message.answer("🧺 По вашему запросу ничего не найдено.")
+        return
+
+    inline_kb = InlineKeyboardMarkup(inline_keyboard=album_buttons(albums))
+    await message.answer("🔀 Выберите альбом для просмотра информации", reply_markup=inline_kb)
+
+def album_buttons(albums):
+    # Создаем кнопки для каждого альбома
+    return [
+        [InlineKeyboardButton(text=f"{album_name} - {album_nick}", callback_data=f"album_{album_id}")]
+        for album_id, album_name, album_nick in albums
+    ]
+
+async def get_albums_page_keyboard(after_id=None, before_id=None):
+    """Клавиатура страницы альбомов с кнопками перехода. Страницы кэшируются до добавления нового альбома"""
+    cache_key = (after_id, before_id)
+    inline_kb = keyboard_cache.get(cache_key)
+    if inline_kb is not None:
+        keyboard_cache.move_to_end(cache_key)
+        return inline_kb
+
+    albums, has_prev, has_next = await db.albums_page(after_id=after_id, before_id=before_id, limit=config.ALBUMS_PAGE_SIZE)
+    if not albums:
+        return None
+
+    buttons = album_buttons(albums)
+
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"albums_prev_{albums[0][0]}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=f"albums_next_{albums[-1][0]}"))
+    if navigation:
+        buttons.append(navigation)
+
+    # Создаем Inline-клавиатуру
+    inline_kb = InlineKeyboardMarkup(inline_keyboard=buttons)
+
+    keyboard_cache[cache_key] = inline_kb
+    while len(keyboard_cache) > config.ALBUMS_PAGE_CACHE_SIZE:
+        keyboard_cache.popitem(last=False)
+    return inline_kb
+
+# Файл со ссылками на альбомы (.txt или .csv) — массовое добавление
+@router.message(F.document)
+async def handle_links_file(message: types.Message):
+    document = message.document
+    if not (document.file_name or '').lower().endswith(('.txt', '.csv')):
+        await message.answer("❌ Пришлите файл .txt или .csv со ссылками на альбомы VK.")
+        return
+
+    if document.file_size and document.file_size > config.BULK_IMPORT_MAX_FILE_SIZE:
+        await message.answer(f"❌ Файл слишком большой, максимум {config.BULK_IMPORT_MAX_FILE_SIZE // 1024} КБ.")
+        return
+
+    file = await message.bot.download(document)
+    await bulk_import(message, extract_album_urls(file.read().decode('utf-8', errors='ignore')))
+
+# Обработчик всех сообщений
+@router.message()
+async def handle_album_link(message: types.Message):
+    album_url = message.text.strip()
+
+    # Несколько ссылок в одном сообщении добавляем одним импортом
+    links = extract_album_urls(album_url)
+    if len(links) > 1:
+        await bulk_import(message, links)
+        return
+
+    # Отправляем сообщение о начале анализа
+    message_wait = await message.answer("⌛ Думаю, подождите немного...")
+
+    # Проверка правильности ссылки
+    if not is_valid_album_url(album_url):
+        try:
+            await message_wait.delete()
+        except:
+            pass
+        await message.answer_photo(photo='https://i.ibb.co/ZdY4JSD/image.png', caption="❌ Вы ввели некорректный формат ссылки на альбом.\n\nℹ️ Ссылка должна быть таких форматов:\nhttps://vk.com/music/album/-2000600197_20600197_805b14b56dae3b32e9\nhttps://vk.com/music/playlist/-147845620_2949\n\n📷 На скриншоте показан пример, как нужно открыть нужный альбом, чтобы получить корректную ссылку. Нажмите на название альбома и Вы перейдёте на его оригинальную страницу.")
+        return
+
+    # Извлекаем основную часть ссылки
+    album_id = extract_album_id(album_url)
+    if not album_id:
+        try:
+            await message_wait.delete()
+        except:
+            pass
+        await message.answer("❌ Не удалось извлечь данные из ссылки. Проверьте формат.")
+        return
+
+    # Проверяем, есть ли альбом с таким ID в базе данных
+    if await db.find_album(album_id):
+        await edit_status(message.bot, message.chat.id, message_wait.message_id, "🤫 Этот альбом уже добавлен в базу данных.\n\nℹ️ Нажмите на /analyze и посмотрите его статистику")
+        return
+
+    # Не даём одному пользователю занять очередь десятками ссылок
+    queue = jobs.get_queue()
+    owner = message.from_user.id if message.from_user else message.chat.id
+    active = await queue.count_active(owner)
+    if active >= config.ALBUM_QUEUE_PER_USER:
+        await edit_status(message.bot, message.chat.id, message_wait.message_id, f"⏳ У вас уже загружается {active} альбомов. Дождитесь, пока они добавятся, и отправьте ссылку снова.")
+        return
+
+    # Парсинг выполняет обработчик задач; ход загрузки и результат появятся в этом же сообщении
+    await edit_status(message.bot, message.chat.id, message_wait.message_id, "⏳ Альбом в очереди на загрузку, это сообщение обновится, когда появятся данные...")
+    payload = {"url": album_url, "vk_key": album_id, "chat_id": message.chat.id, "message_id": message_wait.message_id}
+    job_id = await queue.enqueue(jobs.NEW_ALBUM, payload, dedupe_key=f"new_album:{album_id}", max_attempts=2, owner=owner)
+
+    if job_id is None:
+        # Этот альбом уже добавляется по другой ссылке или другим пользователем
+        await edit_status(message.bot, message.chat.id, message_wait.message_id, "🤫 Этот альбом уже добавлен в базу данных.\n\nℹ️ Нажмите на /analyze и посмотрите его статистику")
+
+async def bulk_import(message, links):
+    """Массовое добавление альбомов: уже добавленные отсекаются одним запросом, новые парсит обработчик задач"""
+    if not links:
+        await message.answer("❌ Не найдено ни одной ссылки на альбом или плейлист VK.")
+        return
+
+    if len(links) > config.BULK_IMPORT_MAX_LINKS:
+        await message.answer(f"❌ За один раз можно добавить не больше {config.BULK_IMPORT_MAX_LINKS} альбомов, а найдено {len(links)}.")
+        return
+
+    existing = await db.existing_vk_keys(list(links))
+    new_links = [[vk_key, url] for vk_key, url in links.items() if vk_key not in existing]
+    if not new_links:
+        await message.answer(f"🤫 Все найденные альбомы ({len(links)}) уже добавлены в базу данных.\n\nℹ️ Нажмите на /analyze и посмотрите их статистику")
+        return
+
+    queue = jobs.get_queue()
+    owner = message.from_user.id if message.from_user else message.chat.id
+    active = await queue.count_active(owner)
+    if active >= config.ALBUM_QUEUE_PER_USER:
+        await message.answer(f"⏳ У вас уже загружается {active} альбомов. Дождитесь, пока они добавятся, и отправьте ссылки снова.")
+        return
+
+    message_status = await message.answer(f"⏳ Найдено альбомов: {len(links)}, новых: {len(new_links)}. Импорт в очереди, это сообщение обновится...")
+    payload = {"links": new_links, "existing": len(existing), "chat_id": message.chat.id, "message_id": message_status.message_id}
+    await queue.enqueue(jobs.BULK_IMPORT, payload, max_attempts=1, owner=owner)
+
+async def edit_status(bot, chat_id, message_id, text, **kwargs):
+    """Замена текста сообщения о статусе; ошибки Telegram (сообщение удалено, текст не изменился) не важны"""
+    try:
+        await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, **kwargs)
+    except Exception as e:
+        logging.debug(f"Не удалось обновить сообщение о статусе: {e}")
+
+# Обработчик нажатий на альбомы
+@router.callback_query(lambda callback_query: callback_query.data.startswith("album_"))
+async def show_album_info(callback_query: types.CallbackQuery):
+    album_id = callback_query.data.split("_")[1]
+
+    try:
+        await callback_query.message.delete()
+    except:
+        pass
+
+    # Извлекаем данные альбома из базы
+    album = await db.get_album(album_id)
+
+    if album:
+        name, nick, genre_year, counts, track_count, date_added  = album
+
+        # Создаем Inline-клавиатуру с кнопками "Статистика" и "Назад"
+        inline_kb = InlineKeyboardMarkup(inline_keyboard=[
+            [
+                InlineKeyboardButton(text="📊 Статистика", callback_data=f"stats_{album_id}"),
+                InlineKeyboardButton(text="🔔 Уведомления", callback_data=f"alerts_{album_id}"),
+                InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_analyze")
+            ]
+        ])
+
+        # Отправляем информацию об альбоме
+        await callback_query.message.answer(f"\n\n📃 <b>Информация об альбоме:</b>\n\n🖥️ Уникальный ID: <b>{album_id}</b>\n🔢 Количество прослушиваний: <b>{counts}</b>\n"
+                                            f"🎵 Количество песен в альбоме: <b>{track_count}</b>\n"
+                                            f"📓 Альбом: <b>{name}</b>\n😶 Исполнитель: <b>{nick}</b>\n🌍 Жанр и год: <b>{genre_year}</b>\n📅 Дата добавления: <b>{date_added}</b>",
+                                            reply_markup=inline_kb, parse_mode='HTML')
+    else:
+        await callback_query.message.answer("❌ Информация об альбоме не найдена.")
+
+
+# Обработчик кнопки "Назад"
+@router.callback_query(lambda callback_query: callback_query.data == "back_to_analyze")
+async def back_to_analyze(callback_query: types.CallbackQuery):
+    # Удаляем предыдущее сообщение с информацией об альбоме
+    try:
+        await callback_query.message.delete()
+    except:
+        pass
+
+    # Вызываем снова команду /analyze
+    await analyze_albums(callback_query.message)
+
+@router.callback_query(lambda callback_query: callback_query.data.startswith("stats_"))
+async def show_stats(callback_query: types.CallbackQuery):
+    album_id = callback_query.data.split("_")[1]
+    chat_id = callback_query.message.chat.id
+
+    # Если новых записей статистики не было, отправляем уже загруженные в Telegram графики
+    cache_key = (album_id, await db.last_stats_id(album_id))
+    file_ids = chart_cache.get(cache_key)
+    if file_ids:
+        chart_cache.move_to_end(cache_key)
+        with stats_chart_seconds.time(stage='send_cached'):
+            await send_charts(callback_query.bot, chat_id, file_ids)
+        return
+
+    # Ограничение на количество графиков (по 10 точек на каждом графике, не более 10 графиков)
+    max_graphs = 10
+    points_per_graph = 10
+
+    # Берём из базы только последние 100 точек (10 графиков по 10 точек), по одной на день
+    dates, plays = [], []
+    with stats_chart_seconds.time(stage='fetch'):
+        async for date, count in db.iter_stats_buckets(album_id, bucket='day', limit=max_graphs * points_per_graph):
+            dates.append(date)
+            plays.append(count)
+
+    if len(dates) < 2:  # Если данных меньше 2-х записей, не строим график
+        await callback_query.message.answer("❗ Данных недостаточно для построения статистики. Необходимо минимум две записи за разные дни.")
+        return
+
+    # Разбиваем данные на группы по 10 записей
+    chunks = [(dates[i:i + points_per_graph], plays[i:i + points_per_graph]) for i in range(0, len(plays), points_per_graph)]
+
+    # Рисуем графики в пуле процессов, сразу в память
+    with stats_chart_seconds.time(stage='render'):
+        images = await charts.render_charts(chunks)
+
+    # Отправляем графики одним альбомом и запоминаем их file_id
+    photos = [BufferedInputFile(image, filename=f"stats_{album_id}_{i + 1}.png") for i, image in enumerate(images)]
+    with stats_chart_seconds.time(stage='send'):
+        chart_cache[cache_key] = await send_charts(callback_query.bot, chat_id, photos)
+    while len(chart_cache) > config.CHART_CACHE_SIZE:
+        chart_cache.popitem(last=False)
+
+async def send_charts(bot, chat_id, photos):
+    """Отправка графиков группами до 10 фото, возвращает file_id загруженных изображений"""
+    file_ids = []
+    for i in range(0, len(photos), 10):
+        group = photos[i:i + 10]
+        if len(group) == 1:
+            messages = [await bot.send_photo(chat_id=chat_id, photo=group[0])]
+        else:
+            messages = await bot.send_media_group(chat_id=chat_id, media=[InputMediaPhoto(media=photo) for photo in group])
+        file_ids.extend(message.photo[-1].file_id for message in messages)
+    return file_ids
+
+# Тестовые данные
+test_urls = [
+    'https://vk.com/music/playlist/-147845620_2949',
+    'https://vk.com/music/playlist/264577489_28',
+    'https://vk.com/music/album/-2000600197_20600197_805b14b56dae3b32e9',
+    'https://vk.com/music/album/-2000113136_7113136_2a00a34a604257e4fe'
+]
+
+# Функция для отправки тестовых сообщений
+async def send_test_messages(bot, chat_id):
+    test_urls = [
+        "https://vk.com/music/playlist/-147845620_2949",
+        "https://vk.com/music/playlist/264577489_28",
+        "https://vk.com/music/album/-2000600197_20600197_805b14b56dae3b32e9",
+        "https://vk.com/music/album/-2000113136_7113136_2a00a34a604257e4fe"
+    ]
+    
+    for url in test_urls:
+        print(f"Отправляем ссылку: {url}")
+        
+        # Создание тестового пользователя
+        test_user = User(id=123456, is_bot=False, first_name="Test", username="testuser")
+        
+        # Создание тестового сообщения с реальным chat_id
+        message = Message(
+            message_id=1,
+            date=datetime.now(),
+            chat=Chat(id=chat_id, type="private"),
+            from_user=test_user,
+            text=url
+        )
+        
+        # Привязываем бота к сообщению
+        message = message.as_(bot)
+        await handle_album_link(message)
+        await asyncio.sleep(2)  # Небольшая пауза между запросами
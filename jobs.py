@@ -0,0 +1,356 @@
+import json
+import time
+from datetime import datetime, timedelta
+import config
+import db
+
+# Виды задач для обработчиков
+REFRESH = 'refresh'        # обновить статистику альбома: {"album_id", "url"}
+NEW_ALBUM = 'new_album'    # добавить альбом по ссылке пользователя: {"url", "vk_key", "chat_id", ...}
+BULK_IMPORT = 'bulk_import'  # добавить много альбомов из сообщения или файла: {"links": [[vk_key, url], ...], "chat_id", ...}
+
+# Задачи пользователей (с владельцем) выполняются раньше фоновых и с ограничением одновременных:
+# ALBUM_JOBS_PER_USER на одного пользователя и ALBUM_JOBS_GLOBAL на все обработчики
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _after(seconds):
+    return (datetime.now() + timedelta(seconds=seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _retry_delay(attempts):
+    return config.JOB_RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0)
+
+
+class SQLiteQueue:
+    """Очередь задач в таблице jobs той же базы. Задача выдаётся обработчику в аренду на JOB_LEASE_SECONDS;
+    если обработчик не продлил аренду (упал или завис), задача снова становится доступной"""
+
+    async def enqueue(self, kind, payload, dedupe_key=None, max_attempts=None, owner=None):
+        """Добавление задачи. Возвращает ID или None, если такая задача уже ждёт или выполняется"""
+        max_attempts = max_attempts or config.JOB_MAX_ATTEMPTS
+
+        async def _enqueue(conn):
+            cursor = await conn.execute('''
+                INSERT INTO jobs (kind, payload, dedupe_key, max_attempts, owner, run_after, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT DO NOTHING
+            ''', (kind, json.dumps(payload, ensure_ascii=False), dedupe_key, max_attempts, owner, _now(), _now()))
+            return cursor.lastrowid if cursor.rowcount else None
+
+        return await db.write(_enqueue)
+
+    async def count_active(self, owner):
+        """Сколько задач пользователя ждут или выполняются"""
+        row = await db.fetchone("SELECT COUNT(*) FROM jobs WHERE owner = ? AND status IN ('pending', 'running')", (owner,))
+        return row[0]
+
+    async def enqueue_many(self, kind, payloads, dedupe_keys, max_attempts=None):
+        """Добавление пачки задач одной транзакцией, дубли пропускаются"""
+        max_attempts = max_attempts or config.JOB_MAX_ATTEMPTS
+        now = _now()
+
+        async def _enqueue(conn):
+            before = conn.total_changes
+            await conn.executemany('''
+                INSERT INTO jobs (kind, payload, dedupe_key, max_attempts, run_after, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT DO NOTHING
+            ''', [(kind, json.dumps(payload, ensure_ascii=False), key, max_attempts, now, now)
+                  for payload, key in zip(payloads, dedupe_keys)])
+            return conn.total_changes - before
+
+        return await db.write(_enqueue)
+
+    async def claim(self, worker_id):
+        """Взять следующую задачу в аренду. Возвращает словарь задачи или None"""
+        now = _now()
+
+        async def _claim(conn):
+            # Задачи с истёкшей арендой, у которых кончились попытки, считаем проваленными
+            await conn.execute('''
+                UPDATE jobs SET status = 'failed', error = 'Обработчик не ответил', dedupe_key = NULL
+                WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts
+            ''', (now,))
+
+            # Сколько задач пользователей сейчас выполняется: всего и у каждого владельца
+            cursor = await conn.execute('''
+                SELECT owner, COUNT(*) FROM jobs
+                WHERE owner IS NOT NULL AND status = 'running' AND lease_until >= ?
+                GROUP BY owner
+            ''', (now,))
+            running = dict(await cursor.fetchall())
+            busy = [owner for owner, count in running.items() if count >= config.ALBUM_JOBS_PER_USER]
+            owned_allowed = sum(running.values()) < config.ALBUM_JOBS_GLOBAL
+
+            # Сначала задачи пользователей, затем фоновые; владельцы, у которых достигнут предел, пропускаются
+            cursor = await conn.execute(f'''
+                UPDATE jobs SET status = 'running', worker_id = ?, lease_until = ?, attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE ((status = 'pending' AND run_after <= ?) OR (status = 'running' AND lease_until < ?))
+                      AND (owner IS NULL OR (? AND owner NOT IN ({','.join('?' * len(busy))})))
+                    ORDER BY owner IS NULL, id
+                    LIMIT 1
+                )
+                RETURNING id, kind, payload, attempts, max_attempts
+            ''', (worker_id, _after(config.JOB_LEASE_SECONDS), now, now, owned_allowed, *busy))
+            return await cursor.fetchone()
+
+        row = await db.write(_claim)
+        if row is None:
+            return None
+
+        job_id, kind, payload, attempts, max_attempts = row
+        return {"id": job_id, "kind": kind, "payload": json.loads(payload), "attempts": attempts, "max_attempts": max_attempts}
+
+    async def heartbeat(self, job, worker_id):
+        """Продление аренды задачи"""
+        await db.write(lambda conn: conn.execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+            (_after(config.JOB_LEASE_SECONDS), job["id"], worker_id)))
+
+    async def set_progress(self, job, text):
+        """Текст о ходе выполнения, бот показывает его пользователю"""
+        await db.write(lambda conn: conn.execute('UPDATE jobs SET progress = ? WHERE id = ?', (text, job["id"])))
+
+    async def fetch_progress(self):
+        """Незавершённые задачи пользователей с текстом о ходе выполнения: (ID, параметры, текст)"""
+        rows = await db.fetchall('''
+            SELECT id, payload, progress FROM jobs
+            WHERE owner IS NOT NULL AND status IN ('pending', 'running') AND progress IS NOT NULL
+        ''')
+        return [(job_id, json.loads(payload), progress) for job_id, payload, progress in rows]
+
+    async def complete(self, job, result=None):
+        """Задача выполнена. Задачи без чата удаляются сразу, остальные ждут, пока бот сообщит пользователю"""
+        if job["payload"].get("chat_id") is None:
+            await db.write(lambda conn: conn.execute('DELETE FROM jobs WHERE id = ?', (job["id"],)))
+            return
+
+        await db.write(lambda conn: conn.execute(
+            "UPDATE jobs SET status = 'done', result = ?, dedupe_key = NULL, lease_until = NULL WHERE id = ?",
+            (json.dumps(result, ensure_ascii=False), job["id"])))
+
+    async def fail(self, job, error):
+        """Ошибка выполнения: повтор с задержкой или окончательный провал"""
+        if job["attempts"] < job["max_attempts"]:
+            await db.write(lambda conn: conn.execute(
+                "UPDATE jobs SET status = 'pending', error = ?, run_after = ?, lease_until = NULL WHERE id = ?",
+                (str(error), _after(_retry_delay(job["attempts"])), job["id"])))
+        elif job["payload"].get("chat_id") is None:
+            await db.write(lambda conn: conn.execute('DELETE FROM jobs WHERE id = ?', (job["id"],)))
+        else:
+            await db.write(lambda conn: conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, dedupe_key = NULL, lease_until = NULL WHERE id = ?",
+                (str(error), job["id"])))
+
+    async def fetch_finished(self, limit=100):
+        """Завершённые задачи, о которых ещё не сообщили"""
+        rows = await db.fetchall('''
+            SELECT id, kind, payload, status, result, error FROM jobs
+            WHERE status IN ('done', 'failed')
+            ORDER BY id
+            LIMIT ?
+        ''', (limit,))
+        return [{"id": job_id, "kind": kind, "payload": json.loads(payload), "status": status,
+                 "result": json.loads(result) if result else None, "error": error}
+                for job_id, kind, payload, status, result, error in rows]
+
+    async def remove(self, job_ids):
+        await db.write(lambda conn: conn.executemany('DELETE FROM jobs WHERE id = ?', [(job_id,) for job_id in job_ids]))
+
+    async def close(self):
+        pass
+
+
+class RedisQueue:
+    """Та же очередь на Redis (или совместимом сервере) для обработчиков на нескольких машинах.
+    Требует пакет redis: pip install redis"""
+
+    PREFIX = 'vk:jobs'
+
+    def __init__(self, url):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url, decode_responses=True)
+
+    def _key(self, *parts):
+        return ':'.join((self.PREFIX,) + tuple(str(part) for part in parts))
+
+    def _pending_key(self, job):
+        # Задачи пользователей лежат в отдельном списке и выдаются раньше фоновых
+        return self._key('pending', 'owned') if job.get("owner") else self._key('pending')
+
+    async def enqueue(self, kind, payload, dedupe_key=None, max_attempts=None, owner=None):
+        job_id = await self.redis.incr(self._key('next_id'))
+        if dedupe_key is not None and not await self.redis.set(self._key('dedupe', dedupe_key), job_id, nx=True):
+            return None
+
+        job = {
+            "kind": kind, "payload": json.dumps(payload, ensure_ascii=False), "dedupe_key": dedupe_key or '',
+            "attempts": 0, "max_attempts": max_attempts or config.JOB_MAX_ATTEMPTS, "status": 'pending',
+            "owner": owner or '',
+        }
+        await self.redis.hset(self._key('job', job_id), mapping=job)
+        if owner:
+            await self.redis.sadd(self._key('active', owner), job_id)
+            await self.redis.sadd(self._key('owned'), job_id)
+        await self.redis.lpush(self._pending_key(job), job_id)
+        return job_id
+
+    async def enqueue_many(self, kind, payloads, dedupe_keys, max_attempts=None):
+        added = 0
+        for payload, key in zip(payloads, dedupe_keys):
+            if await self.enqueue(kind, payload, key, max_attempts) is not None:
+                added += 1
+        return added
+
+    async def count_active(self, owner):
+        return await self.redis.scard(self._key('active', owner))
+
+    async def _release(self, job_id, job):
+        """Задача больше не выполняется: снимаем аренду и убираем её из счётчиков выполняемых"""
+        await self.redis.zrem(self._key('leases'), job_id)
+        if job.get("owner"):
+            await self.redis.srem(self._key('running', 'owned'), job_id)
+            await self.redis.srem(self._key('running', job["owner"]), job_id)
+
+    async def _requeue_expired(self):
+        """Возвращаем в очередь задачи с истёкшей арендой и задачи, у которых прошла задержка повтора"""
+        now = time.time()
+        for job_id in await self.redis.zrangebyscore(self._key('leases'), '-inf', now):
+            if await self.redis.zrem(self._key('leases'), job_id):
+                job = await self.redis.hgetall(self._key('job', job_id))
+                await self._release(job_id, job)
+                if int(job.get("attempts", 0)) >= int(job.get("max_attempts", 1)):
+                    await self._finish(job_id, job, 'failed', error='Обработчик не ответил')
+                else:
+                    await self.redis.lpush(self._pending_key(job), job_id)
+
+        for job_id in await self.redis.zrangebyscore(self._key('delayed'), '-inf', now):
+            if await self.redis.zrem(self._key('delayed'), job_id):
+                job = await self.redis.hgetall(self._key('job', job_id))
+                await self.redis.lpush(self._pending_key(job), job_id)
+
+    async def _pop_owned(self):
+        """Следующая задача пользователя, у которого не достигнут предел одновременных задач.
+        Проверки не атомарны, поэтому при нескольких обработчиках пределы соблюдаются приблизительно"""
+        if await self.redis.scard(self._key('running', 'owned')) >= config.ALBUM_JOBS_GLOBAL:
+            return None
+
+        pending = self._key('pending', 'owned')
+        for _ in range(await self.redis.llen(pending)):
+            job_id = await self.redis.rpop(pending)
+            if job_id is None:
+                return None
+            owner = await self.redis.hget(self._key('job', job_id), 'owner')
+            if await self.redis.scard(self._key('running', owner)) < config.ALBUM_JOBS_PER_USER:
+                return job_id
+            await self.redis.lpush(pending, job_id)
+        return None
+
+    async def claim(self, worker_id):
+        await self._requeue_expired()
+
+        job_id = await self._pop_owned() or await self.redis.rpop(self._key('pending'))
+        if job_id is None:
+            return None
+
+        job_key = self._key('job', job_id)
+        attempts = await self.redis.hincrby(job_key, 'attempts', 1)
+        await self.redis.hset(job_key, mapping={"status": 'running', "worker_id": worker_id})
+        await self.redis.zadd(self._key('leases'), {job_id: time.time() + config.JOB_LEASE_SECONDS})
+
+        job = await self.redis.hgetall(job_key)
+        if job["owner"]:
+            await self.redis.sadd(self._key('running', 'owned'), job_id)
+            await self.redis.sadd(self._key('running', job["owner"]), job_id)
+        return {"id": int(job_id), "kind": job["kind"], "payload": json.loads(job["payload"]),
+                "attempts": attempts, "max_attempts": int(job["max_attempts"])}
+
+    async def heartbeat(self, job, worker_id):
+        await self.redis.zadd(self._key('leases'), {job["id"]: time.time() + config.JOB_LEASE_SECONDS}, xx=True)
+
+    async def set_progress(self, job, text):
+        await self.redis.hset(self._key('job', job["id"]), 'progress', text)
+
+    async def fetch_progress(self):
+        progress = []
+        for job_id in await self.redis.smembers(self._key('owned')):
+            job = await self.redis.hgetall(self._key('job', job_id))
+            if job.get("progress"):
+                progress.append((int(job_id), json.loads(job["payload"]), job["progress"]))
+        return progress
+
+    async def _finish(self, job_id, job, status, result=None, error=None):
+        if job.get("dedupe_key"):
+            await self.redis.delete(self._key('dedupe', job["dedupe_key"]))
+        if job.get("owner"):
+            await self.redis.srem(self._key('active', job["owner"]), job_id)
+            await self.redis.srem(self._key('owned'), job_id)
+
+        if json.loads(job["payload"]).get("chat_id") is None:
+            await self.redis.delete(self._key('job', job_id))
+            return
+
+        await self.redis.hset(self._key('job', job_id), mapping={
+            "status": status, "result": json.dumps(result, ensure_ascii=False), "error": error or '',
+        })
+        await self.redis.lpush(self._key('finished'), job_id)
+
+    async def complete(self, job, result=None):
+        stored = await self.redis.hgetall(self._key('job', job["id"]))
+        await self._release(job["id"], stored)
+        await self._finish(job["id"], stored, 'done', result=result)
+
+    async def fail(self, job, error):
+        stored = await self.redis.hgetall(self._key('job', job["id"]))
+        await self._release(job["id"], stored)
+        if job["attempts"] < job["max_attempts"]:
+            await self.redis.hset(self._key('job', job["id"]), mapping={"status": 'pending', "error": str(error)})
+            await self.redis.zadd(self._key('delayed'), {job["id"]: time.time() + _retry_delay(job["attempts"])})
+        else:
+            await self._finish(job["id"], stored, 'failed', error=str(error))
+
+    async def fetch_finished(self, limit=100):
+        jobs = []
+        for job_id in await self.redis.lrange(self._key('finished'), -limit, -1):
+            job = await self.redis.hgetall(self._key('job', job_id))
+            if not job:
+                continue
+            jobs.append({"id": int(job_id), "kind": job["kind"], "payload": json.loads(job["payload"]),
+                         "status": job["status"], "result": json.loads(job.get("result") or 'null'),
+                         "error": job.get("error") or None})
+        return jobs
+
+    async def remove(self, job_ids):
+        for job_id in job_ids:
+            await self.redis.lrem(self._key('finished'), 0, job_id)
+            await self.redis.delete(self._key('job', job_id))
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+_queue = None
+
+
+def get_queue():
+    """Очередь задач, выбранная в config.JOB_QUEUE_BACKEND"""
+    global _queue
+    if _queue is None:
+        if config.JOB_QUEUE_BACKEND == 'redis':
+            _queue = RedisQueue(config.REDIS_URL)
+        else:
+            _queue = SQLiteQueue()
+    return _queue
+
+
+async def close_queue():
+    global _queue
+    if _queue is not None:
+        await _queue.close()
+        _queue = None
@@ -0,0 +1,97 @@
+"""Обслуживание базы: прореживание старой статистики, возврат свободного места и PRAGMA optimize.
+
+Бот запускает run_maintenance каждые MAINTENANCE_INTERVAL_MINUTES минут. Работа идёт короткими
+транзакциями через общего писателя и прерывается по истечении MAINTENANCE_TIME_BUDGET секунд,
+следующий проход продолжает с того же места. Вручную, при остановленном боте:
+
+    python maintenance.py            # полный проход без ограничения по времени
+    python maintenance.py --vacuum   # один раз перевести существующую базу в auto_vacuum = INCREMENTAL
+"""
+import argparse
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+import config
+import db
+
+# Альбом, после которого продолжится прореживание статистики
+_after_aid = 0
+
+
+def _cutoffs(now):
+    full_since = now - timedelta(days=config.RETENTION_FULL_DAYS)
+    weekly_since = now - timedelta(days=config.RETENTION_WEEKLY_DAYS)
+    daily_since = now - timedelta(days=config.RETENTION_DAILY_DAYS)
+    return full_since.strftime('%Y-%m-%d %H:%M:%S'), weekly_since.strftime('%Y-%m-%d %H:%M:%S'), daily_since.strftime('%Y-%m-%d')
+
+
+async def compact(deadline):
+    """Прореживание статистики по RETENTION_ALBUMS_PER_STEP альбомов за транзакцию, пока не выйдет время.
+    Возвращает число удалённых записей"""
+    global _after_aid
+    full_since, weekly_since, daily_since = _cutoffs(datetime.now())
+    until_aid = await db.max_stats_aid()
+    deleted = 0
+
+    while time.monotonic() < deadline:
+        if _after_aid >= until_aid:
+            _after_aid = 0  # Круг пройден, следующий проход начнёт сначала
+            break
+        step_until = _after_aid + config.RETENTION_ALBUMS_PER_STEP
+        deleted += await db.compact_stats(_after_aid, step_until, full_since, weekly_since, daily_since)
+        _after_aid = step_until
+
+    return deleted
+
+
+async def reclaim(deadline):
+    """Возврат свободных страниц файлу базы по VACUUM_PAGES_PER_STEP за транзакцию, пока не выйдет время"""
+    free = None
+    while time.monotonic() < deadline:
+        free = await db.incremental_vacuum(config.VACUUM_PAGES_PER_STEP)
+        if not free:
+            break
+    return free
+
+
+async def run_maintenance(budget=None):
+    """Один проход обслуживания: половина времени на прореживание, остаток — на возврат места"""
+    budget = config.MAINTENANCE_TIME_BUDGET if budget is None else budget
+    start = time.monotonic()
+    try:
+        deleted = await compact(start + budget / 2)
+        free = await reclaim(start + budget)
+        await db.optimize()
+    except Exception as e:
+        logging.error(f"Ошибка обслуживания базы: {e}", exc_info=True)
+        return
+
+    if free is None:
+        logging.info(f"Обслуживание базы: удалено записей статистики: {deleted}. "
+                     f"auto_vacuum выключен, место не возвращается — выполните python maintenance.py --vacuum")
+    else:
+        logging.info(f"Обслуживание базы: удалено записей статистики: {deleted}, свободных страниц осталось: {free}, "
+                     f"{time.monotonic() - start:.1f} с")
+
+
+async def main(args):
+    await db.init_db()
+    if args.vacuum:
+        logging.info("Полная пересборка базы, это может занять время...")
+        await db.vacuum()
+
+    await db.connect()
+    try:
+        await run_maintenance(math.inf)
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Прореживание статистики и обслуживание файла базы")
+    parser.add_argument('--vacuum', action='store_true',
+                        help="полная пересборка базы с переводом в auto_vacuum = INCREMENTAL (бот должен быть остановлен)")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(main(parser.parse_args()))
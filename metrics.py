@@ -0,0 +1,191 @@
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+
+# Все метрики процесса, выводятся в текстовом формате Prometheus на /metrics
+_registry = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Counter:
+    """Счётчик, который только растёт"""
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in self.values.items():
+            yield f'{self.name}{_format_labels(labels)} {value}'
+
+
+class Gauge:
+    """Текущее значение; может вычисляться функцией в момент чтения метрик"""
+
+    def __init__(self, name, documentation, function=None):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.values = {}
+        _registry.append(self)
+
+    def set(self, value, **labels):
+        self.values[tuple(sorted(labels.items()))] = value
+
+    def collect(self):
+        if self.function is not None:
+            for labels, value in self.function():
+                self.set(value, **labels)
+
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} gauge'
+        for labels, value in self.values.items():
+            yield f'{self.name}{_format_labels(labels)} {value}'
+
+
+class Histogram:
+    """Распределение длительностей по корзинам"""
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.values = {}  # метки -> [счётчики корзин..., сумма, количество]
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        data = self.values.get(key)
+        if data is None:
+            data = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            data[index] += 1
+        data[-2] += value
+        data[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, data in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                yield f'{self.name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}'
+            yield f'{self.name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {data[-1]}'
+            yield f'{self.name}_sum{_format_labels(labels)} {data[-2]}'
+            yield f'{self.name}_count{_format_labels(labels)} {data[-1]}'
+
+
+class _Timer:
+    """Контекстный менеджер и декоратор для замера длительности в гистограмму"""
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with _Timer(self.histogram, self.labels):
+                return await func(*args, **kwargs)
+        return wrapper
+
+
+def timed_call(histogram):
+    """Декоратор асинхронной функции: длительность пишется в гистограмму с меткой call=<имя функции>"""
+    def decorator(func):
+        return histogram.time(call=func.__name__)(func)
+    return decorator
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+# Метрики бота
+scrape_stage_seconds = Histogram('vk_scrape_stage_seconds', 'Длительность этапов парсинга альбома')
+scrape_results = Counter('vk_scrape_results_total', 'Результаты парсинга альбомов')
+refresh_seconds = Histogram('vk_refresh_seconds', 'Длительность прохода обновления статистики', buckets=(1, 10, 60, 300, 900, 3600, 10800))
+refresh_albums = Counter('vk_refresh_albums_total', 'Альбомы, обработанные при обновлении статистики')
+jobs_processed = Counter('vk_jobs_total', 'Задачи парсинга, выполненные обработчиками')
+db_seconds = Histogram('vk_db_seconds', 'Длительность обращений к базе данных')
+stats_chart_seconds = Histogram('vk_stats_chart_seconds', 'Длительность этапов show_stats')
+event_loop_lag_seconds = Histogram('vk_event_loop_lag_seconds', 'Задержка цикла событий', buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+event_loop_lag_last = Gauge('vk_event_loop_lag_last_seconds', 'Последняя измеренная задержка цикла событий')
+startup_seconds = Gauge('vk_startup_seconds', 'Время запуска бота по этапам: импорт модулей и готовность к приёму сообщений')
+updates_in_flight = Gauge('vk_updates_in_flight', 'Апдейты Telegram, которые сейчас обрабатываются или ждут очереди')
+
+
+async def monitor_event_loop(interval=1.0):
+    """Засыпаем на interval и смотрим, насколько позже цикл событий нас разбудил"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(time.perf_counter() - start - interval, 0.0)
+        event_loop_lag_seconds.observe(lag)
+        event_loop_lag_last.set(lag)
+
+
+_runner = None
+_monitor_task = None
+
+
+async def start_server(host, port):
+    """HTTP-сервер с /metrics и фоновый замер задержки цикла событий"""
+    global _runner, _monitor_task
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+
+    _monitor_task = asyncio.create_task(monitor_event_loop())
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+
+
+async def stop_server():
+    global _runner, _monitor_task
+    if _monitor_task is not None:
+        _monitor_task.cancel()
+        _monitor_task = None
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
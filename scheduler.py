@@ -0,0 +1,182 @@
+"""Периодические задачи бота: постановка альбомов на обновление, результаты загрузки альбомов,
+уведомления подписчикам и обслуживание базы. Запускаются из go.py через start(bot)"""
+from datetime import datetime, timedelta
+import random
+import logging
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+import config
+import db
+import jobs
+import alerts
+import maintenance
+import handlers
+from handlers import edit_status
+from metrics import refresh_seconds
+
+_scheduler = AsyncIOScheduler()
+
+album_id = 1  # for testing stats
+
+# Очередь отправки уведомлений подписчикам с ограничением частоты, создаётся в start()
+alert_queue = None
+
+# Последний показанный пользователю текст о ходе загрузки по ID задачи
+job_progress = {}
+
+async def deliver_alerts():
+    """Удаляем из базы отправленные уведомления и забираем новые в очередь отправки"""
+    await db.delete_alerts(alert_queue.take_sent())
+    if alert_queue.pending() >= config.ALERTS_BATCH_SIZE:
+        return
+    for alert_id, chat_id, text in await db.fetch_alerts(alert_queue.last_id, config.ALERTS_BATCH_SIZE):
+        alert_queue.put(alert_id, chat_id, text)
+
+async def notify_finished_jobs(bot):
+    """Показываем пользователям ход загрузки альбомов и результат в их сообщениях о статусе"""
+    queue = jobs.get_queue()
+
+    for job_id, payload, progress in await queue.fetch_progress():
+        if job_progress.get(job_id) != progress:
+            job_progress[job_id] = progress
+            await edit_status(bot, payload["chat_id"], payload["message_id"], progress)
+
+    finished = await queue.fetch_finished()
+    if not finished:
+        return
+
+    for job in finished:
+        payload = job["payload"]
+        job_progress.pop(job["id"], None)
+        if payload.get("chat_id") is None:
+            continue
+
+        if job["kind"] == jobs.BULK_IMPORT:
+            await notify_bulk_import(bot, job)
+            continue
+
+        chat_id, message_id = payload["chat_id"], payload["message_id"]
+        album_info = job["result"]
+        if job["status"] != 'done':
+            # Проверка, если это ошибка, связанная с отсутствием альбома
+            if job["error"] == "Такого альбома не существует":
+                await edit_status(bot, chat_id, message_id, "❌ Такого альбома не существует.")
+            else:
+                logging.error(f"Ошибка добавления альбома по ссылке: {job['error']}")
+                await edit_status(bot, chat_id, message_id, "❌ Произошла ошибка при получении данных, попробуйте снова.\n\n📃 Возможно, этот альбом не существует или был удалён.")
+        elif album_info["album_id"] is None:
+            await edit_status(bot, chat_id, message_id, "🤫 Этот альбом уже добавлен в базу данных.\n\nℹ️ Нажмите на /analyze и посмотрите его статистику")
+        else:
+            # Список альбомов изменился — сбрасываем кэш страниц /analyze
+            handlers.keyboard_cache.clear()
+
+            # Показываем результат пользователю
+            await edit_status(bot, chat_id, message_id, f"☑️ <b>Альбом успешно добавлен в анализатор.</b>\n\n📃 <b>Информация об альбоме</b>\n\n🔢 Количество прослушиваний: <b>{album_info['plays']}</b>\n"
+                              f"🎵 Количество песен в альбоме: <b>{album_info['track_count']}</b>\n📓 Альбом: <b>{album_info['name']}</b>\n"
+                              f"😶 Исполнитель: <b>{album_info['nick']}</b>\n🌍 Жанр и год: <b>{album_info['genre_year']}</b>", parse_mode='HTML')
+
+    await queue.remove([job["id"] for job in finished])
+
+async def notify_bulk_import(bot, job):
+    """Итог массового добавления альбомов"""
+    chat_id, message_id = job["payload"]["chat_id"], job["payload"]["message_id"]
+    if job["status"] != 'done':
+        logging.error(f"Ошибка массового добавления альбомов: {job['error']}")
+        await edit_status(bot, chat_id, message_id, "❌ Произошла ошибка при импорте альбомов, попробуйте снова.")
+        return
+
+    summary = job["result"]
+    if summary["added"]:
+        # Список альбомов изменился — сбрасываем кэш страниц /analyze
+        handlers.keyboard_cache.clear()
+
+    text = (f"📥 <b>Импорт завершён</b>\n\n🔗 Найдено альбомов: <b>{summary['total']}</b>\n☑️ Добавлено: <b>{summary['added']}</b>\n"
+            f"🤫 Уже были в базе: <b>{summary['existing']}</b>\n❌ Не удалось загрузить: <b>{len(summary['failed'])}</b>")
+    if summary["failed"]:
+        text += "\n\n" + "\n".join(summary["failed"][:20])
+    await edit_status(bot, chat_id, message_id, text, parse_mode='HTML', disable_web_page_preview=True)
+
+@refresh_seconds.time()
+async def update_album_stats():
+    """Ставит в очередь задач обновление альбомов, у которых подошёл срок. Парсят их обработчики из worker.py.
+    За один проход берётся не больше REFRESH_BATCH_LIMIT альбомов, самые просроченные первыми"""
+    queue = jobs.get_queue()
+
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    albums = await db.fetch_due_albums(now, config.REFRESH_BATCH_LIMIT)
+    if not albums:
+        return
+
+    # Пока задача ждёт или повторяется, альбом не занимает место в следующих проходах.
+    # Успешное обновление назначит настоящую дату, окончательная ошибка — отложит альбом (worker.handle_refresh)
+    await db.postpone_refresh([album_id for album_id, _, _ in albums], config.REFRESH_PENDING_MINUTES * 60)
+
+    # Альбомы, которые ещё ждут в очереди с прошлого прохода, повторно не добавляются
+    queued = await queue.enqueue_many(jobs.REFRESH, [{"album_id": album_id, "url": album_url} for album_id, album_url, _ in albums],
+                                      [f"refresh:{album_id}" for album_id, _, _ in albums])
+    logging.info(f"Обновление статистики: к обновлению {len(albums)} альбомов, новых задач в очереди: {queued}")
+
+# testing stats
+# Примерные данные о прослушиваниях
+def generate_random_stats(start_date, days):
+    stats = []
+    current_date = start_date
+    for _ in range(days):
+        plays = random.randint(1000, 10000)  # Случайное количество прослушиваний от 1K до 10K
+        stats.append((album_id, plays, current_date.strftime('%Y-%m-%d %H:%M:%S')))
+        current_date += timedelta(days=5)  # Добавляем по 5 дней
+    return stats
+
+# Функция для вставки данных в таблицу stats
+async def insert_stats(album_id, stats):
+    await db.insert_stats(stats)
+    print(f"Статистика для альбома {album_id} успешно добавлена.")
+
+async def start(bot):
+    """Регистрация периодических задач по TEST_MODE и запуск планировщика"""
+    global alert_queue
+
+    # Результаты добавления альбомов от обработчиков задач
+    _scheduler.add_job(notify_finished_jobs, 'interval', seconds=config.JOB_NOTIFY_INTERVAL, args=(bot,))
+
+    # Уведомления подписчикам об изменениях статистики
+    alert_queue = alerts.SendQueue(bot)
+    alert_queue.start()
+    _scheduler.add_job(deliver_alerts, 'interval', seconds=config.JOB_NOTIFY_INTERVAL)
+
+    if config.TEST_MODE == 1:
+        logging.warning('Внимание! Запущен тестовый режим #1, Вам доступна команда /test')
+
+    elif config.TEST_MODE == 2:
+        logging.info("Внимание! Запущен тестовый режим #2. Обновление статистики включится через 5 секунд")
+        # Разовая задача вместо ожидания, чтобы бот начал отвечать сразу
+        _scheduler.add_job(update_album_stats, 'date', run_date=datetime.now() + timedelta(seconds=5))
+
+    elif config.TEST_MODE == 3:
+        logging.warning(f'Внимание! Запущен тестовый режим #3, сейчас будет добавлена фейковая статистика на альбом ID: {album_id}.')
+
+        start_date = datetime(2024, 10, 22)
+        test_stats = generate_random_stats(start_date, 25)
+
+        try:
+            await insert_stats(album_id, test_stats)
+        except Exception as e:
+            logging.error(f"Ошибка при добавлении тестовой статистики: {e}")
+
+    else:
+        logging.info(f"Бот запущен в обычном режиме: поиск альбомов к обновлению каждые {config.REFRESH_TICK_MINUTES} мин.")
+        # Небольшие проходы каждые несколько минут; у каждого альбома своя дата обновления в базе
+        _scheduler.add_job(update_album_stats, 'interval', minutes=config.REFRESH_TICK_MINUTES, next_run_time=datetime.now())
+        # Прореживание старой статистики и возврат места короткими проходами
+        _scheduler.add_job(maintenance.run_maintenance, 'interval', minutes=config.MAINTENANCE_INTERVAL_MINUTES)
+
+    # Старт планировщика
+    _scheduler.start()
+
+async def stop():
+    """Остановка планировщика и очереди уведомлений"""
+    if _scheduler.running:
+        _scheduler.shutdown(wait=False)
+    if alert_queue is not None:
+        await alert_queue.stop()
+        # Неотправленные уведомления остаются в базе до следующего запуска
+        await db.delete_alerts(alert_queue.take_sent())
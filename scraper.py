@@ -0,0 +1,358 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+from contextlib import asynccontextmanager
+import aiohttp
+import config
+import metrics
+from metrics import scrape_stage_seconds, scrape_results
+from utils import extract_album_id
+from vk_html import parse_album_html, build_album_info
+
+# Общая HTTP-сессия с пулом соединений для лёгкого парсинга m.vk.com
+_session = None
+
+# Один браузер на весь процесс и пул переиспользуемых вкладок
+_playwright = None
+_browser = None
+_slots = None  # asyncio.Queue со слотами пула
+_start_lock = asyncio.Lock()
+
+# Ограничители частоты запросов по хостам
+_limiters = {}
+
+
+class TokenBucket:
+    """Ограничитель частоты: не больше rate запросов в секунду с запасом burst"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                # Ждём, пока накопится следующий токен
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ScrapeCache:
+    """LRU-кэш результатов парсинга с временем жизни. Одновременные запросы одного
+    альбома ждут один и тот же парсинг вместо запуска нескольких"""
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.items = OrderedDict()  # ключ -> (время истечения, результат)
+        self.in_flight = {}         # ключ -> задача парсинга
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def get(self, key, loader):
+        item = self.items.get(key)
+        if item is not None:
+            expires, value = item
+            if expires > time.monotonic():
+                self.items.move_to_end(key)
+                self.hits += 1
+                return dict(value)
+            del self.items[key]
+
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(loader())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+
+        # shield: отмена одного ожидающего не отменяет парсинг для остальных
+        return dict(await asyncio.shield(task))
+
+    def _on_done(self, key, task):
+        self.in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+
+        self.items[key] = (time.monotonic() + self.ttl, task.result())
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced, "size": len(self.items)}
+
+
+scrape_cache = ScrapeCache(config.SCRAPE_CACHE_TTL, config.SCRAPE_CACHE_SIZE)
+
+metrics.Gauge('vk_scrape_cache', 'Счётчики кэша парсинга: hits, misses, coalesced, size',
+              function=lambda: [({"kind": kind}, value) for kind, value in scrape_cache.stats().items()])
+
+
+def _limiter(url):
+    host = urlparse(url).netloc
+    if host not in _limiters:
+        _limiters[host] = TokenBucket(config.SCRAPE_RATE_PER_HOST, config.SCRAPE_BURST_PER_HOST)
+    return _limiters[host]
+
+
+async def start():
+    """Создание HTTP-сессии. Браузер запускается сразу только для SCRAPER_BACKEND = 'browser',
+    иначе — при первой странице, которую не удалось разобрать без него"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=config.SCRAPER_HTTP_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=config.SCRAPER_HTTP_TIMEOUT),
+            headers={
+                "User-Agent": config.SCRAPER_USER_AGENT,
+                "Accept-Language": "ru-RU,ru;q=0.9",
+            },
+        )
+
+    if config.SCRAPER_BACKEND == 'browser':
+        await start_browser()
+
+
+async def start_browser():
+    """Запуск headless Chromium и создание пула вкладок"""
+    global _playwright, _browser, _slots
+    async with _start_lock:
+        if _browser is not None and _browser.is_connected():
+            return
+
+        with scrape_stage_seconds.time(stage='browser_launch'):
+            if _playwright is None:
+                # Playwright нужен только запасному парсингу через браузер, поэтому загружается при первом запуске
+                from playwright.async_api import async_playwright
+                _playwright = await async_playwright().start()
+            _browser = await _playwright.chromium.launch(headless=True)
+
+        # Слот пула: контекст, вкладка и количество использований
+        _slots = asyncio.Queue()
+        for _ in range(config.SCRAPER_CONCURRENCY):
+            _slots.put_nowait({"context": None, "page": None, "uses": 0})
+
+        logging.info(f"Браузер запущен, размер пула вкладок: {config.SCRAPER_CONCURRENCY}")
+
+
+async def stop():
+    """Закрытие HTTP-сессии, всех вкладок, браузера и Playwright"""
+    global _session, _playwright, _browser, _slots
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+    async with _start_lock:
+        if _slots is not None:
+            while not _slots.empty():
+                await _close_slot(_slots.get_nowait())
+            _slots = None
+
+        if _browser is not None:
+            try:
+                await _browser.close()
+            except Exception as e:
+                logging.warning(f"Ошибка при закрытии браузера: {e}")
+            _browser = None
+
+        if _playwright is not None:
+            await _playwright.stop()
+            _playwright = None
+
+
+async def _close_slot(slot):
+    """Закрываем контекст слота, чтобы при следующем использовании он создался заново"""
+    if slot["context"] is not None:
+        try:
+            await slot["context"].close()
+        except Exception:
+            pass
+    slot["context"] = None
+    slot["page"] = None
+    slot["uses"] = 0
+
+
+@asynccontextmanager
+async def _page():
+    """Выдаёт вкладку из пула. Вкладка пересоздаётся после N использований или после ошибки"""
+    if _browser is None or not _browser.is_connected():
+        await start_browser()
+
+    slots = _slots
+    with scrape_stage_seconds.time(stage='page_acquire'):
+        slot = await slots.get()
+    try:
+        if slot["page"] is None or slot["page"].is_closed():
+            with scrape_stage_seconds.time(stage='page_create'):
+                await _close_slot(slot)
+                slot["context"] = await _browser.new_context()
+                await slot["context"].route('**/*', _route)
+                slot["page"] = await slot["context"].new_page()
+
+        try:
+            yield slot["page"]
+        except Exception:
+            # После ошибки состояние вкладки неизвестно — пересоздаём её
+            await _close_slot(slot)
+            raise
+
+        slot["uses"] += 1
+        if slot["uses"] >= config.SCRAPER_PAGE_MAX_USES:
+            await _close_slot(slot)
+    finally:
+        slots.put_nowait(slot)
+
+        # Если браузер упал, перезапускаем его для следующих запросов
+        if _browser is not None and not _browser.is_connected():
+            logging.warning("Браузер отключился, перезапускаем")
+            await start_browser()
+
+
+async def get_album_info(url):
+    """Данные об альбоме или плейлисте: из кэша, из уже идущего парсинга или новым парсингом"""
+    key = extract_album_id(url) or url
+    return await scrape_cache.get(key, lambda: _scrape_album_info(url))
+
+
+async def _scrape_album_info(url):
+    """Сначала лёгкий разбор m.vk.com, при неудаче — полноценная страница в Chromium"""
+    if config.SCRAPER_BACKEND == 'http':
+        try:
+            album_info = await _fetch_album_info_http(url)
+            scrape_results.inc(backend='http', result='success')
+            return album_info
+        except Exception as e:
+            scrape_results.inc(backend='http', result='timeout' if isinstance(e, asyncio.TimeoutError) else 'failure')
+            logging.info(f"Лёгкий парсинг {url} не удался ({e}), открываем страницу в браузере")
+
+    return await _fetch_album_info_browser(url)
+
+
+def mobile_url(url):
+    """Та же ссылка на альбом, но на серверной мобильной версии VK"""
+    parsed = urlparse(url)
+    return config.SCRAPER_MOBILE_HOST.rstrip('/') + parsed.path + (f'?{parsed.query}' if parsed.query else '')
+
+
+async def _fetch_album_info_http(url):
+    """Загрузка HTML мобильной версии через общую HTTP-сессию и разбор без браузера"""
+    if _session is None or _session.closed:
+        await start()
+
+    page_url = mobile_url(url)
+    with scrape_stage_seconds.time(stage='rate_limit'):
+        await _limiter(page_url).acquire()
+
+    with scrape_stage_seconds.time(stage='http_fetch'):
+        async with _session.get(page_url) as response:
+            response.raise_for_status()
+            html = await response.text()
+
+    with scrape_stage_seconds.time(stage='http_parse'):
+        return parse_album_html(html, url)
+
+
+# Скрипт ожидания: все нужные элементы есть на странице, блоков info не меньше min_info
+_WAIT_JS = """
+({selectors, info, minInfo}) => selectors.every(s => document.querySelector(s))
+    && document.querySelectorAll(info).length >= minInfo
+"""
+
+# Скрипт извлечения всех полей за один вызов
+_EXTRACT_JS = """
+({info, title, author}) => {
+    const text = (s) => { const el = document.querySelector(s); return el ? el.innerText : null; };
+    return {
+        info: Array.from(document.querySelectorAll(info), el => el.innerText.trim()),
+        title: text(title),
+        author: text(author),
+    };
+}
+"""
+
+
+async def _route(route):
+    """Пропускаем только документ, скрипты и данные VK — без картинок, шрифтов, медиа и сторонних хостов"""
+    request = route.request
+    host = urlparse(request.url).hostname or ''
+    own_host = any(host == allowed or host.endswith('.' + allowed) for allowed in config.SCRAPER_ALLOWED_HOSTS)
+
+    if request.resource_type in config.SCRAPER_BLOCKED_RESOURCES or not own_host:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+# Функция для парсинга данных об альбоме или плейлисте с помощью Playwright
+async def _fetch_album_info_browser(url):
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    with scrape_stage_seconds.time(stage='rate_limit'):
+        await _limiter(url).acquire()
+
+    if 'music/album' in url:
+        selectors = {"info": '.AudioPlaylistSnippet__info', "title": '.AudioPlaylistSnippet__title--main',
+                     "author": '.AudioPlaylistSnippet__author a[href^="/artist/"]'}
+        required, min_info = list(selectors.values()), 1
+    else:
+        selectors = {"info": '.AudioPlaylistSnippet__info', "title": '.AudioPlaylistSnippet__title--main',
+                     "author": '.AudioPlaylistSnippet__author a'}
+        required, min_info = [selectors["info"]], 2
+
+    try:
+        async with _page() as page:
+            with scrape_stage_seconds.time(stage='page_goto'):
+                await page.goto(url, wait_until='domcontentloaded', timeout=config.SCRAPER_GOTO_TIMEOUT)
+
+            # Одно ожидание всех элементов и одно извлечение всех полей
+            with scrape_stage_seconds.time(stage='selector_wait'):
+                await page.wait_for_function(_WAIT_JS, arg={"selectors": required, "info": selectors["info"], "minInfo": min_info},
+                                             timeout=config.SCRAPER_SELECTOR_TIMEOUT)
+            with scrape_stage_seconds.time(stage='evaluate'):
+                data = await page.evaluate(_EXTRACT_JS, selectors)
+
+            album_info = build_album_info(url, data["info"], data["title"], data["author"])
+
+        scrape_results.inc(backend='browser', result='success')
+        return album_info
+    except PlaywrightTimeoutError:
+        scrape_results.inc(backend='browser', result='timeout')
+        logging.error(f"Ошибка Timeout для URL: {url}")
+        raise Exception("Такого альбома или плейлиста не существует")
+    except Exception as e:
+        scrape_results.inc(backend='browser', result='failure')
+        logging.error(f'Ошибка при парсинге {url}: {e}')
+        raise Exception(f'Ошибка при парсинге: {str(e)}')
+
+
+async def get_album_info_with_retry(url, retries=None):
+    """get_album_info с повторными попытками и экспоненциальной задержкой со случайным разбросом"""
+    retries = config.SCRAPE_RETRIES if retries is None else retries
+
+    for attempt in range(retries + 1):
+        try:
+            return await get_album_info(url)
+        except Exception as e:
+            if attempt >= retries:
+                raise
+
+            delay = random.uniform(0, config.SCRAPE_RETRY_BASE_DELAY * 2 ** attempt)
+            logging.warning(f"Попытка {attempt + 1} для {url} не удалась ({e}), повтор через {delay:.1f} с")
+            await asyncio.sleep(delay)
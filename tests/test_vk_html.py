@@ -0,0 +1,97 @@
+"""Разбор страниц альбомов без сети: сохранённые страницы из benchmarks/fixtures, в том числе мобильные m.vk.com
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils import parse_plays
+from vk_html import ParseError, build_album_info, parse_album_html
+
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+ALBUM_URL = 'https://m.vk.com/music/album/-2000123_456_abcdef'
+PLAYLIST_URL = 'https://m.vk.com/music/playlist/264577489_12'
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as file:
+        return file.read()
+
+
+def test_desktop_album():
+    info = parse_album_html(fixture('album.html'), 'https://vk.com/music/album/-1_1')
+    assert info == {"plays": "12,4K прослушиваний\n 12 аудиозаписей", "track_count": "12", "name": "Ночные огни",
+                    "nick": "Тестовый исполнитель", "genre_year": "Хип-хоп · 2024"}
+    assert parse_plays(info["plays"]) == 12400
+
+
+def test_desktop_playlist():
+    info = parse_album_html(fixture('playlist.html'), 'https://vk.com/music/playlist/264577489_12')
+    assert info["track_count"] == "153"
+    assert info["name"] == "Лучшее за неделю"
+    assert info["nick"] == "Тестовый пользователь"
+    assert parse_plays(info["plays"]) == 3000
+
+
+def test_mobile_album():
+    # Разметка m.vk.com: .AudioPlaylistRoot__*
+    info = parse_album_html(fixture('mobile_album.html'), ALBUM_URL)
+    assert info["track_count"] == "10"
+    assert info["name"] == "Ночные огни"
+    assert info["nick"] == "Тестовый исполнитель"
+    assert info["genre_year"] == "Поп · 2023"
+    assert parse_plays(info["plays"]) == 1200000
+
+
+def test_mobile_playlist():
+    # Разметка m.vk.com: .audioPlaylist__*
+    info = parse_album_html(fixture('mobile_playlist.html'), PLAYLIST_URL)
+    assert info["track_count"] == "24"
+    assert info["name"] == "Лучшее за неделю"
+    assert info["nick"] == "Тестовый пользователь"
+    assert info["genre_year"] == "это плейлист, нет таких данных"
+    assert parse_plays(info["plays"]) == 15408
+
+
+def test_build_album_info_single():
+    # У сингла нет количества аудиозаписей и жанра
+    info = build_album_info(ALBUM_URL, ["532 прослушивания"], "Сингл", "")
+    assert info == {"plays": "532 прослушивания", "track_count": "1", "name": "Сингл",
+                    "nick": "Не указано", "genre_year": "не указано"}
+
+
+@pytest.mark.parametrize("url, texts", [
+    (ALBUM_URL, []),
+    (PLAYLIST_URL, ["24 аудиозаписи"]),
+    ('https://m.vk.com/audios1', ["1 прослушивание"]),
+])
+def test_build_album_info_errors(url, texts):
+    with pytest.raises(ParseError):
+        build_album_info(url, texts, "Название", "Исполнитель")
+
+
+def test_page_without_info():
+    with pytest.raises(ParseError):
+        parse_album_html('<html><body><div class="page_block">Доступ ограничен</div></body></html>', ALBUM_URL)
+
+
+@pytest.mark.parametrize("text, plays", [
+    ("12 345 прослушиваний", 12345),
+    ("15\u00a0408", 15408),
+    ("1\u202f234\u202f567", 1234567),
+    ("12,345", 12345),
+    ("1,2 млн", 1200000),
+    ("3 тыс.", 3000),
+    ("4.5K", 4500),
+    ("2M", 2000000),
+    ("", 0),
+    (None, 0),
+    (77, 77),
+])
+def test_parse_plays(text, plays):
+    assert parse_plays(text) == plays
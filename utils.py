@@ -0,0 +1,76 @@
+import re
+
+# Ссылка на альбом или плейлист: владелец, ID плейлиста и необязательный ключ доступа
+ALBUM_URL_RE = re.compile(r'/music/(album|playlist)/(-?\d+)_(\d+)(?:_([0-9a-zA-Z]+))?')
+VALID_ALBUM_URL_RE = re.compile(r'https?://(m\.)?vk\.com/music/(album|playlist)/[-\d]+_[\d]+(?:_[a-zA-Z0-9]+)?')
+
+
+def is_valid_album_url(url):
+    # Допускаем ссылки на альбомы и плейлисты
+    return VALID_ALBUM_URL_RE.match(url)
+
+
+def parse_album_url(url):
+    """Разбор ссылки на (owner_id, playlist_id, access_hash) или None"""
+    match = ALBUM_URL_RE.search(url)
+    if not match:
+        return None
+    return int(match.group(2)), int(match.group(3)), match.group(4)
+
+
+# Функция для извлечения основной части ссылки для альбома или плейлиста
+def extract_album_id(url):
+    """Канонический ключ альбома "owner_id_playlist_id" (vk_key). Ключ доступа в него не входит:
+    один и тот же альбом может открываться по ссылкам с разными ключами или вовсе без него"""
+    parsed = parse_album_url(url)
+    if parsed is None:
+        return None
+    owner_id, playlist_id, _ = parsed
+    return f'{owner_id}_{playlist_id}'
+
+
+def extract_album_urls(text):
+    """Все ссылки на альбомы и плейлисты из текста: {vk_key: ссылка} без повторов, в порядке появления"""
+    urls = {}
+    for match in VALID_ALBUM_URL_RE.finditer(text):
+        url = match.group(0)
+        vk_key = extract_album_id(url)
+        # Ссылки вроде /music/album/1-2_3 проходят проверку формата, но ключа у них нет
+        if vk_key is not None:
+            urls.setdefault(vk_key, url)
+    return urls
+
+
+# Число с необязательными разделителями и сокращением: "12K", "1,5 млн", "12 345", "3.4 тыс."
+_DIGIT_SPACES_RE = re.compile(r'(?<=\d)[\s\u00a0\u2009\u202f]+(?=\d)')
+_PLAYS_RE = re.compile(r'(\d+(?:[.,]\d+)*)\s*(тыс|млрд|млн|[kкmмb](?![a-zа-яё]))?', re.IGNORECASE)
+_GROUPED_RE = re.compile(r'\d{1,3}(?:[.,]\d{3})+')
+_MULTIPLIERS = {'тыс': 1000, 'k': 1000, 'к': 1000,
+                'млн': 1000000, 'm': 1000000, 'м': 1000000,
+                'млрд': 1000000000, 'b': 1000000000}
+
+
+# Функция для преобразования строки с количеством прослушиваний в число
+def parse_plays(plays_str):
+    if plays_str is None:
+        return 0
+    if isinstance(plays_str, int):
+        return plays_str
+
+    # Склеиваем разряды, разделённые пробелами (в том числе неразрывными и узкими)
+    text = _DIGIT_SPACES_RE.sub('', str(plays_str).lower())
+
+    match = _PLAYS_RE.search(text)
+    if not match:
+        return 0
+
+    number, suffix = match.groups()
+    if not suffix and _GROUPED_RE.fullmatch(number):
+        # "12,345" или "12.345" без сокращения — это разделители разрядов
+        return int(number.replace(',', '').replace('.', ''))
+
+    # Оставляем только последний разделитель как десятичную точку
+    parts = re.split(r'[.,]', number)
+    value = float(''.join(parts[:-1]) + '.' + parts[-1]) if len(parts) > 1 else float(number)
+
+    return int(round(value * _MULTIPLIERS.get(suffix or '', 1)))
@@ -0,0 +1,77 @@
+from selectolax.lexbor import LexborHTMLParser
+
+# Селекторы полей страницы альбома: сначала как в полной версии, затем варианты мобильной m.vk.com
+INFO_SELECTORS = ('.AudioPlaylistSnippet__info', '.AudioPlaylistRoot__info', '.audioPlaylist__footer')
+TITLE_SELECTORS = ('.AudioPlaylistSnippet__title--main', '.AudioPlaylistRoot__title', '.audioPlaylist__title')
+ALBUM_AUTHOR_SELECTORS = ('.AudioPlaylistSnippet__author a[href^="/artist/"]', '.AudioPlaylistRoot__author a', '.audioPlaylist__owner a')
+PLAYLIST_AUTHOR_SELECTORS = ('.AudioPlaylistSnippet__author a', '.AudioPlaylistRoot__author a', '.audioPlaylist__owner a')
+
+
+class ParseError(Exception):
+    """На странице нет нужных элементов — её нужно открыть в браузере"""
+
+
+def _nodes(tree, selectors):
+    for selector in selectors:
+        nodes = tree.css(selector)
+        if nodes:
+            return nodes
+    return []
+
+
+def _text(node):
+    return node.text(deep=True, separator=' ', strip=True)
+
+
+def _first_text(tree, selectors, default="Не указано"):
+    nodes = _nodes(tree, selectors)
+    return _text(nodes[0]) if nodes else default
+
+
+def parse_album_html(html, url):
+    """Разбор HTML страницы альбома или плейлиста в те же поля, что отдаёт парсер на Playwright"""
+    tree = LexborHTMLParser(html)
+    info = _nodes(tree, INFO_SELECTORS)
+    author_selectors = ALBUM_AUTHOR_SELECTORS if 'music/album' in url else PLAYLIST_AUTHOR_SELECTORS
+
+    return build_album_info(url, [_text(node) for node in info],
+                            _first_text(tree, TITLE_SELECTORS), _first_text(tree, author_selectors))
+
+
+def build_album_info(url, info_texts, album_name, artist_name):
+    """Поля альбома из текстов блоков .AudioPlaylistSnippet__info, названия и исполнителя"""
+    if not info_texts:
+        raise ParseError(f"Не найден блок с информацией об альбоме: {url}")
+
+    if 'music/album' in url:
+        # Количество прослушиваний и количество песен
+        play_count_text = info_texts[0]
+
+        if 'аудиозаписей' in play_count_text:
+            between = play_count_text.split('прослушиваний')[1].split('аудиозаписей')[0]
+            track_count = ''.join(char for char in between if char.isdigit()) or "не указано"
+        else:
+            track_count = '1'
+
+        # Жанр и год
+        genre_year_text = info_texts[1] if len(info_texts) > 1 else "не указано"
+
+    elif 'music/playlist' in url:
+        if len(info_texts) < 2:
+            raise ParseError(f"Не найдено количество прослушиваний плейлиста: {url}")
+
+        # Количество треков (число может быть разбито на несколько узлов)
+        track_count = ''.join(char for char in info_texts[0] if char.isdigit()) or "не указано"
+        play_count_text = info_texts[1].split('прослушиваний')[0].strip()
+        genre_year_text = "это плейлист, нет таких данных"
+
+    else:
+        raise ParseError(f"Ссылка не ведёт на альбом или плейлист: {url}")
+
+    return {
+        "plays": play_count_text,
+        "track_count": track_count,
+        "name": album_name or "Не указано",
+        "nick": artist_name or "Не указано",
+        "genre_year": genre_year_text.strip()
+    }
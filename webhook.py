@@ -0,0 +1,77 @@
+"""Приём апдейтов Telegram: режим вебхука на aiohttp и общий ограничитель одновременной обработки.
+
+В режиме BOT_MODE = 'webhook' Telegram сам присылает апдейты POST-запросами на WEBHOOK_PATH. Сервер сразу
+отвечает 200, а апдейт обрабатывается в фоне; одновременно обрабатывается не больше UPDATE_CONCURRENCY
+апдейтов (и в режиме polling тоже), остальные ждут. При остановке новые апдейты не принимаются,
+а начатые дорабатываются в пределах SHUTDOWN_DRAIN_TIMEOUT секунд."""
+import asyncio
+import logging
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+import config
+from metrics import updates_in_flight
+
+
+class UpdateLimiter(BaseMiddleware):
+    """Не больше limit апдейтов обрабатываются одновременно. Считает все начатые апдейты,
+    включая ожидающие своей очереди, чтобы при остановке их можно было дождаться"""
+
+    def __init__(self, limit):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    async def __call__(self, handler, event, data):
+        self.active += 1
+        self.idle.clear()
+        updates_in_flight.set(self.active)
+        try:
+            async with self.semaphore:
+                return await handler(event, data)
+        finally:
+            self.active -= 1
+            updates_in_flight.set(self.active)
+            if not self.active:
+                self.idle.set()
+
+    async def drain(self, timeout):
+        """Ожидание обработки начатых апдейтов. Возвращает False, если время вышло"""
+        if self.active:
+            logging.info(f"Дорабатываем начатые апдейты: {self.active}")
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Не дождались обработки {self.active} апдейтов за {timeout} с")
+            return False
+        return True
+
+
+async def set_webhook(bot, dp):
+    """Регистрация адреса вебхука в Telegram. Апдейты, пришедшие во время перезапуска, Telegram
+    доставит после него, если не включён DROP_PENDING_UPDATES"""
+    if not config.WEBHOOK_URL:
+        logging.warning("WEBHOOK_URL не задан, вебхук в Telegram не регистрируется")
+        return
+
+    await bot.set_webhook(config.WEBHOOK_URL.rstrip('/') + config.WEBHOOK_PATH,
+                          secret_token=config.WEBHOOK_SECRET or None,
+                          allowed_updates=dp.resolve_used_update_types(),
+                          drop_pending_updates=config.DROP_PENDING_UPDATES)
+    logging.info(f"Вебхук зарегистрирован: {config.WEBHOOK_URL.rstrip('/')}{config.WEBHOOK_PATH}")
+
+
+def create_app(dp, bot):
+    """aiohttp-приложение с обработчиком вебхука. Хуки старта и остановки диспетчера
+    выполняются вместе с приложением, HTTP-сессия бота закрывается последней"""
+    app = web.Application()
+    setup_application(app, dp, bot=bot)
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=config.WEBHOOK_SECRET or None).register(app, path=config.WEBHOOK_PATH)
+    return app
+
+
+def run(dp, bot):
+    logging.info(f"Бот запущен в режиме вебхука на {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}{config.WEBHOOK_PATH}")
+    web.run_app(create_app(dp, bot), host=config.WEBHOOK_HOST, port=config.WEBHOOK_PORT,
+                shutdown_timeout=config.SHUTDOWN_DRAIN_TIMEOUT, print=None)
@@ -0,0 +1,275 @@
+"""Обработчик задач парсинга: берёт задачи из очереди (jobs.py), парсит альбомы и пишет результаты в базу.
+
+Запускается внутри бота (config.EMBEDDED_WORKER) или отдельными процессами, в том числе на других машинах:
+
+    python worker.py
+"""
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime
+import config
+import db
+import jobs
+import metrics
+import scraper
+from metrics import refresh_albums, jobs_processed
+from scraper import get_album_info, get_album_info_with_retry
+
+# Задачи обработчиков и писателя статистики этого процесса
+_consumers = []
+_writer = None
+_results = None
+_stopping = None  # asyncio.Event: обработчики не берут новые задачи и завершаются после текущей
+
+# Результат обработчика передан писателю статистики, он и завершит задачу после сохранения в базу
+# и остановит продление её аренды job["lease"]: пока задача ждёт в пачке, аренда продлевается
+PENDING_SAVE = object()
+
+
+async def handle_refresh(job, results):
+    """Обновление статистики альбома: результат уходит в очередь записи пачками,
+    задача завершается только после того, как пачка сохранена"""
+    album_id, album_url = job["payload"]["album_id"], job["payload"]["url"]
+    try:
+        album_info = await get_album_info_with_retry(album_url)
+
+        # Проверяем данные, которые вернула функция get_album_info
+        logging.info(f"Данные альбома {album_id}: {album_info}")
+
+        if 'plays' not in album_info:
+            raise ValueError(f"Не найдено поле 'plays' для альбома {album_id}. Данные: {album_info}")
+    except Exception:
+        refresh_albums.inc(result='failure')
+        if job["attempts"] >= job["max_attempts"]:
+            # Попытки кончились: откладываем альбом, иначе он будет первым в каждом проходе планировщика
+            await db.postpone_refresh([album_id])
+        raise
+
+    # Сохраняем количество прослушиваний напрямую
+    await results.put((album_id, album_info['plays'], job))
+    refresh_albums.inc(result='success')
+    return PENDING_SAVE
+
+
+async def handle_new_album(job, results):
+    """Добавление альбома по ссылке пользователя. Возвращает ID альбома (None, если он уже есть) и его данные"""
+    payload = job["payload"]
+    queue = jobs.get_queue()
+    await queue.set_progress(job, "🔎 Открываю страницу альбома...")
+    album_info = await get_album_info(payload["url"])
+
+    await queue.set_progress(job, f"💾 Сохраняю альбом «{album_info['name']}»...")
+
+    track_count = album_info.get('track_count', 'не указано')  # Получаем количество песен
+    current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    inserted_id = await db.insert_album(payload["vk_key"], payload["url"], album_info["name"], album_info["nick"],
+                                        album_info["genre_year"], album_info["plays"], track_count, current_date)
+    return {"album_id": inserted_id, **album_info, "track_count": track_count}
+
+
+async def handle_bulk_import(job, results):
+    """Массовое добавление: альбомы парсятся параллельно (не больше BULK_IMPORT_CONCURRENCY сразу)
+    и записываются в базу одной транзакцией. Возвращает итог для пользователя.
+
+    ALBUM_JOBS_PER_USER ограничивает задачи в очереди, а импорт — одна задача: сколько альбомов
+    она парсит одновременно, задаёт только BULK_IMPORT_CONCURRENCY"""
+    payload = job["payload"]
+    links = payload["links"]
+    queue = jobs.get_queue()
+    semaphore = asyncio.Semaphore(config.BULK_IMPORT_CONCURRENCY)
+    rows, failed = [], []
+    done = 0
+
+    async def scrape(vk_key, url):
+        nonlocal done
+        async with semaphore:
+            try:
+                album_info = await get_album_info(url)
+                rows.append((vk_key, url, album_info["name"], album_info["nick"], album_info["genre_year"], album_info["plays"],
+                             album_info.get('track_count', 'не указано'), datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            except Exception as e:
+                logging.error(f"Импорт: не удалось загрузить {url}: {e}")
+                failed.append(url)
+
+        done += 1
+        if done % 10 == 0 and done < len(links):
+            await queue.set_progress(job, f"📥 Загружено альбомов: {done} из {len(links)}...")
+
+    await asyncio.gather(*(scrape(vk_key, url) for vk_key, url in links))
+
+    await queue.set_progress(job, f"💾 Сохраняю альбомы: {len(rows)}...")
+    added = await db.insert_albums(rows)
+
+    # Альбомы, которые успели добавить по отдельным ссылкам во время импорта, тоже считаются уже добавленными
+    return {"total": len(links) + payload["existing"], "added": added,
+            "existing": payload["existing"] + len(rows) - added, "failed": failed}
+
+
+HANDLERS = {
+    jobs.REFRESH: handle_refresh,
+    jobs.NEW_ALBUM: handle_new_album,
+    jobs.BULK_IMPORT: handle_bulk_import,
+}
+
+
+async def keep_lease(queue, job, worker_id):
+    """Продлеваем аренду задачи, пока она выполняется"""
+    while True:
+        await asyncio.sleep(config.JOB_LEASE_SECONDS / 3)
+        try:
+            await queue.heartbeat(job, worker_id)
+        except Exception as e:
+            logging.error(f"Не удалось продлить аренду задачи {job['id']}: {e}")
+
+
+async def update_job(worker_id, job, action):
+    """Запись состояния задачи в очередь. Ошибка базы или Redis не должна останавливать обработчик:
+    задача, которую не удалось отметить, вернётся в очередь, когда истечёт её аренда"""
+    try:
+        await action
+    except Exception as e:
+        logging.error(f"[{worker_id}] Не удалось обновить задачу #{job['id']} в очереди: {e}", exc_info=True)
+
+
+async def consumer(queue, worker_id, results):
+    """Берёт задачи из очереди по одной и выполняет их"""
+    while not _stopping.is_set():
+        try:
+            job = await queue.claim(worker_id)
+        except Exception as e:
+            logging.error(f"[{worker_id}] Ошибка чтения очереди задач: {e}", exc_info=True)
+            job = None
+
+        if job is None:
+            await asyncio.sleep(config.JOB_POLL_INTERVAL)
+            continue
+
+        lease = job["lease"] = asyncio.create_task(keep_lease(queue, job, worker_id))
+        result = None
+        try:
+            result = await HANDLERS[job["kind"]](job, results)
+        except Exception as e:
+            jobs_processed.inc(kind=job["kind"], result='failure')
+            logging.error(f"[{worker_id}] Ошибка задачи {job['kind']} #{job['id']} (попытка {job['attempts']}): {e}")
+            if job["attempts"] < job["max_attempts"] and job["payload"].get("chat_id") is not None:
+                await update_job(worker_id, job, queue.set_progress(job, "⚠️ Не удалось загрузить данные, скоро попробую ещё раз..."))
+            await update_job(worker_id, job, queue.fail(job, e))
+        else:
+            jobs_processed.inc(kind=job["kind"], result='success')
+            if result is not PENDING_SAVE:
+                await update_job(worker_id, job, queue.complete(job, result))
+        finally:
+            if result is not PENDING_SAVE:
+                lease.cancel()
+
+
+async def stats_writer(results):
+    """Единственный писатель статистики в процессе: сохраняет её пачками по STATS_BATCH_SIZE записей,
+    неполную пачку — если STATS_FLUSH_INTERVAL секунд не было новых результатов или первая запись
+    ждёт половину JOB_LEASE_SECONDS. Задачи обновления завершаются после сохранения пачки, при ошибке — повторяются"""
+    queue = jobs.get_queue()
+    loop = asyncio.get_running_loop()
+    batch = []
+    flush_at = None  # Крайний срок сохранения пачки, пока аренда её задач ещё не истекла
+    while True:
+        timeout = config.STATS_FLUSH_INTERVAL
+        if flush_at is not None:
+            timeout = max(0, min(timeout, flush_at - loop.time()))
+        try:
+            item = await asyncio.wait_for(results.get(), timeout)
+        except asyncio.TimeoutError:
+            item = False
+
+        if item:
+            if not batch:
+                flush_at = loop.time() + config.JOB_LEASE_SECONDS / 2
+            batch.append(item)
+
+        if batch and (not item or len(batch) >= config.STATS_BATCH_SIZE or loop.time() >= flush_at):
+            try:
+                # Вставляем новые записи в таблицу stats и сдвигаем дату следующего обновления одним коммитом
+                await db.save_stats_batch([(album_id, plays) for album_id, plays, _ in batch],
+                                          datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            except Exception as e:
+                logging.error(f"Ошибка сохранения статистики ({len(batch)} записей): {e}", exc_info=True)
+                for _, _, job in batch:
+                    await update_job('stats_writer', job, queue.fail(job, e))
+            else:
+                for _, _, job in batch:
+                    await update_job('stats_writer', job, queue.complete(job))
+            finally:
+                for _, _, job in batch:
+                    job["lease"].cancel()
+            batch = []
+            flush_at = None
+
+        if item is None:
+            return
+
+
+async def start_workers(count=None):
+    """Запуск count обработчиков задач и писателя статистики в текущем цикле событий"""
+    global _writer, _results, _stopping
+    count = count or config.REFRESH_WORKERS
+    queue = jobs.get_queue()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    _stopping = asyncio.Event()
+    _results = asyncio.Queue()
+    _writer = asyncio.create_task(stats_writer(_results))
+    _consumers.extend(asyncio.create_task(consumer(queue, f"{prefix}:{i}", _results)) for i in range(count))
+    logging.info(f"Запущено обработчиков задач: {count}, очередь: {config.JOB_QUEUE_BACKEND}")
+
+
+async def stop_workers(timeout=0):
+    """Остановка обработчиков: новые задачи не берутся, начатые дорабатываются не дольше timeout секунд;
+    накопленная статистика дописывается в базу. Прерванные задачи вернутся в очередь, когда истечёт их аренда"""
+    global _writer, _results
+    if _stopping is not None:
+        _stopping.set()
+    if _consumers and timeout:
+        _, pending = await asyncio.wait(_consumers, timeout=timeout)
+        if pending:
+            logging.warning(f"Не дождались завершения задач парсинга: {len(pending)}")
+
+    for task in _consumers:
+        task.cancel()
+    await asyncio.gather(*_consumers, return_exceptions=True)
+    _consumers.clear()
+
+    if _writer is not None:
+        await _results.put(None)
+        await _writer
+        _writer = _results = None
+
+    logging.info(f"Кэш парсинга: {scraper.scrape_cache.stats()}")
+
+
+async def main():
+    await db.init_db()
+    await db.connect()
+    await scraper.start()
+
+    if config.WORKER_METRICS_PORT:
+        await metrics.start_server(config.METRICS_HOST, config.WORKER_METRICS_PORT)
+
+    await start_workers()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stop_workers(config.SHUTDOWN_DRAIN_TIMEOUT)
+        await metrics.stop_server()
+        await scraper.stop()
+        await jobs.close_queue()
+        await db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass